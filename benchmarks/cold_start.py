@@ -0,0 +1,88 @@
+"""
+Cold-start report for the API server.
+
+Imports server.py in a fresh interpreter with `python -X importtime`, reports
+the total import time and the slowest modules, and compares the result
+against a budget. Warm-up is disabled for the measurement so only the
+start-up path itself is timed.
+
+Usage:
+    python benchmarks/cold_start.py [--budget-ms 800] [--runs 3] [--top 10] [--json]
+
+Exits with status 1 when the median import time is over budget.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BUDGET_MS = float(os.getenv("COLD_START_BUDGET_MS", "800"))
+
+
+def measure_import(module="server"):
+    """Import module in a fresh interpreter and return (total_ms, {module: cumulative_ms})."""
+    env = dict(os.environ, WARMUP_MODE="off")
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, env=env, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr}")
+
+    modules = {}
+    total_us = None
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative_us, name = line[len("import time:"):].split("|")
+        name = name.strip()
+        modules[name] = int(cumulative_us) / 1000
+        if name == module:
+            total_us = int(cumulative_us)
+    if total_us is None:
+        raise RuntimeError(f"No importtime entry found for {module}")
+    return total_us / 1000, modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Track server cold-start import time against a budget.")
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--json", action="store_true", help="Print a machine-readable report.")
+    args = parser.parse_args()
+
+    totals = []
+    slowest = {}
+    for _ in range(args.runs):
+        total_ms, modules = measure_import()
+        totals.append(total_ms)
+        for name, ms in modules.items():
+            slowest[name] = max(slowest.get(name, 0), ms)
+
+    median_ms = statistics.median(totals)
+    top = sorted(((ms, name) for name, ms in slowest.items() if name != "server"), reverse=True)[:args.top]
+    report = {
+        "module": "server",
+        "runs_ms": totals,
+        "median_ms": median_ms,
+        "budget_ms": args.budget_ms,
+        "within_budget": median_ms <= args.budget_ms,
+        "slowest_imports_ms": {name: ms for ms, name in top}
+    }
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"server import: median {median_ms:.1f} ms over {args.runs} runs (budget {args.budget_ms:.0f} ms)")
+        for ms, name in top:
+            print(f"  {ms:8.1f} ms  {name}")
+        print("OK" if report["within_budget"] else "OVER BUDGET")
+    return 0 if report["within_budget"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
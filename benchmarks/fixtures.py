@@ -0,0 +1,146 @@
+"""
+Synthetic fetch_data payloads for offline benchmarks.
+
+Stores are modeled on the recorded Places results in data/ (types, primary
+types, ratings, review texts and coordinates around the recorded centroid);
+review texts are re-assembled from recorded sentences so every store gets
+distinct reviews. Weather follows the Open-Meteo daily (and optionally
+hourly) response shape. Generation is deterministic for a given seed.
+
+Usage:
+    python benchmarks/fixtures.py --stores 1000 [--reviews 5] [--hourly] [--seed 0] [-o payload.json]
+"""
+import argparse
+import json
+import os
+import random
+import re
+import sys
+from datetime import date, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = os.path.join(ROOT, "data")
+
+# Spread of synthetic stores around the recorded centroid, in degrees (~2-3 km).
+COORDINATE_SPREAD = 0.02
+
+
+def _load_recorded():
+    with open(os.path.join(DATA_DIR, "processed_stores.json")) as f:
+        stores = json.load(f)
+    with open(os.path.join(DATA_DIR, "cleaned_weather.json")) as f:
+        weather = json.load(f)
+    return stores, weather
+
+
+def _sentences(stores):
+    sentences = []
+    for store in stores:
+        for review in store.get("reviews") or []:
+            text = (review.get("text") or {}).get("text") or ""
+            sentences.extend(s.strip() for s in re.split(r"(?<=[.!?])\s+", text) if s.strip())
+    return sentences or ["Great store."]
+
+
+def _review(rng, sentences, index, publish_time):
+    text = " ".join(rng.sample(sentences, min(len(sentences), rng.randint(2, 6))))
+    return {
+        "name": f"places/synthetic-{index}/reviews/{rng.getrandbits(64):016x}",
+        "relativePublishTimeDescription": "a week ago",
+        "rating": rng.randint(1, 5),
+        "text": {"text": text, "languageCode": "en"},
+        "originalText": {"text": text, "languageCode": "en"},
+        "authorAttribution": {"displayName": f"Reviewer {rng.randint(1, 10 ** 6)}"},
+        "publishTime": publish_time
+    }
+
+
+def make_stores(count, reviews_per_store=5, seed=0):
+    """Return count Places-style store dicts with reviews_per_store reviews each."""
+    rng = random.Random(seed)
+    recorded, _ = _load_recorded()
+    sentences = _sentences(recorded)
+    lat0 = sum(s["location.latitude"] for s in recorded) / len(recorded)
+    lon0 = sum(s["location.longitude"] for s in recorded) / len(recorded)
+    publish_time = recorded[0]["reviews"][0]["publishTime"] if recorded[0].get("reviews") else "2025-06-13T15:13:55Z"
+
+    stores = []
+    for i in range(count):
+        template = recorded[i % len(recorded)]
+        stores.append({
+            "types": list(template["types"]),
+            "formattedAddress": template["formattedAddress"],
+            "rating": round(min(5.0, max(1.0, rng.gauss(template["rating"], 0.3))), 1),
+            "primaryType": template["primaryType"],
+            "reviews": [_review(rng, sentences, i, publish_time) for _ in range(reviews_per_store)],
+            "location": {
+                "latitude": lat0 + rng.uniform(-COORDINATE_SPREAD, COORDINATE_SPREAD),
+                "longitude": lon0 + rng.uniform(-COORDINATE_SPREAD, COORDINATE_SPREAD)
+            },
+            "displayName": {"text": f"{template['displayName.text']} #{i}", "languageCode": "en"}
+        })
+    return stores
+
+
+def make_weather(days=7, hourly=False, seed=0, start=None):
+    """Return an Open-Meteo style forecast for days days, starting at start (default: the recorded first day)."""
+    rng = random.Random(seed)
+    _, recorded = _load_recorded()
+    start = start or date.fromisoformat(recorded[0]["time"])
+    daily = {"time": [], "temperature_2m_max": [], "temperature_2m_min": [],
+             "precipitation_sum": [], "weathercode": []}
+    for d in range(days):
+        day = recorded[d % len(recorded)]
+        daily["time"].append((start + timedelta(days=d)).isoformat())
+        daily["temperature_2m_max"].append(round(day["temperature_2m_max"] + rng.uniform(-2, 2), 1))
+        daily["temperature_2m_min"].append(round(day["temperature_2m_min"] + rng.uniform(-2, 2), 1))
+        daily["precipitation_sum"].append(day["precipitation_sum"])
+        daily["weathercode"].append(day["weathercode"])
+    weather = {"latitude": 42.34, "longitude": -71.1, "timezone": "America/New_York", "daily": daily}
+
+    if hourly:
+        series = {"time": [], "temperature_2m": [], "relative_humidity_2m": [],
+                  "wind_speed_10m": [], "precipitation": []}
+        for d in range(days):
+            low, high = daily["temperature_2m_min"][d], daily["temperature_2m_max"][d]
+            for h in range(24):
+                # Coldest around 05:00, warmest around 15:00.
+                phase = 1 - abs(h - 15) / 10 if 5 <= h <= 25 else 0
+                series["time"].append(f"{(start + timedelta(days=d)).isoformat()}T{h:02d}:00")
+                series["temperature_2m"].append(round(low + (high - low) * max(0.0, phase), 1))
+                series["relative_humidity_2m"].append(rng.randint(40, 95))
+                series["wind_speed_10m"].append(round(rng.uniform(0, 30), 1))
+                series["precipitation"].append(round(daily["precipitation_sum"][d] / 24, 2))
+        weather["hourly"] = series
+    return weather
+
+
+def make_payload(stores, reviews_per_store=5, hourly=False, seed=0, zipcode="02215"):
+    """Return a payload shaped like fetch_data's result for a synthetic market of stores stores."""
+    return {
+        "zipcode": zipcode,
+        "stores": make_stores(stores, reviews_per_store, seed),
+        "weather": make_weather(hourly=hourly, seed=seed)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a synthetic fetch_data payload as JSON.")
+    parser.add_argument("--stores", type=int, default=20)
+    parser.add_argument("--reviews", type=int, default=5, help="Reviews per store.")
+    parser.add_argument("--hourly", action="store_true", help="Include the hourly forecast.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-o", "--output", help="Output file (default: stdout).")
+    args = parser.parse_args()
+
+    payload = make_payload(args.stores, args.reviews, args.hourly, args.seed)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(payload, f)
+    else:
+        json.dump(payload, sys.stdout)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,115 @@
+"""
+Closed-loop load test for a running server.
+
+Meant to be pointed at a local stand-in: start the server with
+UPSTREAM_MODE=replay (and REPLAY_LATENCY set to the latency profile to
+simulate) so Places, Open-Meteo and Gemini answers come from recordings,
+then drive /recommend with a fixed number of concurrent clients.
+
+Usage:
+    UPSTREAM_MODE=replay REPLAY_LATENCY_GEMINI=lognormal:1800,0.4 python server.py
+    python benchmarks/load_test.py --url http://localhost:3000 [--concurrency 16]
+        [--requests 500] [--zipcodes 02215,10001] [--store-types grocery_store]
+        [--mode refined] [--bypass-cache] [--json]
+
+Reports throughput, latency percentiles and status-code counts.
+"""
+import argparse
+import itertools
+import json
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+
+def _percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def run(url, concurrency, total, zipcodes, store_types, mode="refined", bypass_cache=False, timeout=60):
+    """Send total requests with concurrency clients; returns (latencies_s, statuses, elapsed_s)."""
+    targets = itertools.cycle(itertools.product(zipcodes, store_types))
+    targets_lock = threading.Lock()
+    local = threading.local()
+    latencies = []
+    statuses = {}
+    results_lock = threading.Lock()
+
+    def one(_):
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+        with targets_lock:
+            zipcode, store_type = next(targets)
+        params = {"zipcode": zipcode, "store_type": store_type, "mode": mode}
+        if bypass_cache:
+            params["bypass_cache"] = "true"
+        start = time.perf_counter()
+        try:
+            status = session.get(f"{url}/recommend", params=params, timeout=timeout).status_code
+        except requests.exceptions.RequestException as e:
+            status = type(e).__name__
+        elapsed = time.perf_counter() - start
+        with results_lock:
+            latencies.append(elapsed)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(one, range(total)))
+    return latencies, statuses, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Drive /recommend on a running server and report latency.")
+    parser.add_argument("--url", default="http://localhost:3000")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--zipcodes", default="02215")
+    parser.add_argument("--store-types", default="grocery_store")
+    parser.add_argument("--mode", choices=("refined", "fast"), default="refined")
+    parser.add_argument("--bypass-cache", action="store_true", help="Skip the recommendation cache on every request.")
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--json", action="store_true", help="Print a machine-readable report.")
+    args = parser.parse_args()
+
+    latencies, statuses, elapsed = run(
+        args.url.rstrip("/"), args.concurrency, args.requests,
+        [z for z in args.zipcodes.split(",") if z], [t for t in args.store_types.split(",") if t],
+        args.mode, args.bypass_cache, args.timeout
+    )
+    latencies.sort()
+    report = {
+        "url": args.url,
+        "concurrency": args.concurrency,
+        "requests": len(latencies),
+        "elapsed_s": elapsed,
+        "throughput_rps": len(latencies) / elapsed if elapsed else None,
+        "p50_ms": _percentile(latencies, 0.50) * 1000 if latencies else None,
+        "p95_ms": _percentile(latencies, 0.95) * 1000 if latencies else None,
+        "p99_ms": _percentile(latencies, 0.99) * 1000 if latencies else None,
+        "max_ms": latencies[-1] * 1000 if latencies else None,
+        "mean_ms": statistics.fmean(latencies) * 1000 if latencies else None,
+        "statuses": {str(status): count for status, count in statuses.items()}
+    }
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"{report['requests']} requests in {elapsed:.1f} s ({report['throughput_rps']:.1f} req/s) "
+              f"with {args.concurrency} clients")
+        print(f"latency ms: p50 {report['p50_ms']:.0f}  p95 {report['p95_ms']:.0f}  "
+              f"p99 {report['p99_ms']:.0f}  max {report['max_ms']:.0f}")
+        print("statuses: " + ", ".join(f"{status}: {count}" for status, count in sorted(report["statuses"].items())))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
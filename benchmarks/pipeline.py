@@ -0,0 +1,241 @@
+"""
+Offline benchmark for the feature pipeline and the /recommend path.
+
+Synthesizes store and weather payloads at several market sizes (see
+fixtures.py), times each pipeline stage on them and runs the full
+/recommend request through the Flask test client with fetch_data and Gemini
+stubbed out, so no API keys or network access are needed. For every stage
+and size it reports latency percentiles, throughput and the tracemalloc peak.
+
+Usage:
+    python benchmarks/pipeline.py [--sizes 20,200,1000,5000] [--runs 3] [--reviews 5]
+        [--engine pandas|numpy] [--hourly] [--gemini-latency-ms 0]
+        [--json] [--output report.json] [--compare baseline.json] [--tolerance 0.2]
+
+With --compare, exits with status 1 when any stage's p50 is more than
+--tolerance (a fraction) slower than in the baseline report.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+import types
+import warnings
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# The server must not warm up in the background or write artifacts while timed.
+os.environ.setdefault("WARMUP_MODE", "off")
+os.environ.setdefault("ARTIFACT_MODE", "off")
+os.environ.setdefault("COALESCE_REQUESTS", "false")
+
+from fixtures import make_payload  # noqa: E402
+
+DEFAULT_SIZES = "20,200,1000,5000"
+STAGES = ("clean_store_data", "process_store_data", "process_weather_data",
+          "build_feature_vector", "compute_store_sentiment", "build_pipeline_context", "recommend")
+
+
+def _percentile(sorted_values, q):
+    index = min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def _summarize(timings, items):
+    timings = sorted(timings)
+    mean = statistics.fmean(timings)
+    return {
+        "runs": len(timings),
+        "p50_ms": _percentile(timings, 0.50) * 1000,
+        "p95_ms": _percentile(timings, 0.95) * 1000,
+        "p99_ms": _percentile(timings, 0.99) * 1000,
+        "mean_ms": mean * 1000,
+        "min_ms": timings[0] * 1000,
+        "max_ms": timings[-1] * 1000,
+        "stores_per_s": items / mean if mean else None,
+        "calls_per_s": 1 / mean if mean else None
+    }
+
+
+def _peak_memory(fn):
+    """Run fn once under tracemalloc and return its peak allocation in MiB."""
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak / (1024 * 1024)
+
+
+def _stub_server(payload, campaign, gemini_latency):
+    """Import server with fetch_data and Gemini replaced by in-process stubs."""
+    import server
+    server.app.logger.setLevel(logging.CRITICAL)
+
+    class Response:
+        text = json.dumps(campaign)
+        usage_metadata = None
+
+    class Model:
+        def __init__(self, name):
+            pass
+
+        def generate_content(self, prompt, generation_config=None, **kwargs):
+            if gemini_latency:
+                time.sleep(gemini_latency)
+            return Response()
+
+    genai = types.SimpleNamespace(
+        GenerativeModel=Model,
+        types=types.SimpleNamespace(GenerationConfig=lambda **kwargs: kwargs)
+    )
+    server.fetch_data = lambda zipcode, store_type: payload
+    server.get_genai = lambda: genai
+    return server.app.test_client()
+
+
+def _stage_functions(payload, engine, client):
+    from src.cleaning import clean_store_data
+    from src.feature_extraction import process_store_data
+    from src.feature_pipeline import build_feature_vector, build_pipeline_context
+    from src.numpy_features import clean_store_records, process_store_records
+    from src.sentiment import _score_cache, compute_store_sentiment
+    from src.weather_features import process_weather_data
+
+    stores, weather = payload["stores"], payload["weather"]
+    clean = clean_store_records if engine == "numpy" else clean_store_data
+    process = process_store_records if engine == "numpy" else process_store_data
+
+    def sentiment():
+        # Reviews are new on every request in the worst case; time the uncached scorer.
+        _score_cache.clear()
+        return compute_store_sentiment(stores)
+
+    def pipeline():
+        _score_cache.clear()
+        return build_pipeline_context(payload, engine=engine)
+
+    def recommend():
+        _score_cache.clear()
+        response = client.get("/recommend?zipcode=02215&store_type=grocery_store&bypass_cache=true")
+        if response.status_code != 200:
+            raise RuntimeError(f"/recommend returned {response.status_code}: {response.get_data(as_text=True)}")
+
+    return {
+        "clean_store_data": lambda: clean(stores),
+        "process_store_data": lambda: process(stores),
+        "process_weather_data": lambda: process_weather_data(weather),
+        "build_feature_vector": lambda: build_feature_vector(payload),
+        "compute_store_sentiment": sentiment,
+        "build_pipeline_context": pipeline,
+        "recommend": recommend
+    }
+
+
+def run(sizes, runs, reviews, engine, hourly, gemini_latency, stages=STAGES):
+    from src.sentiment import check_resources
+    if not check_resources():
+        raise RuntimeError("The VADER lexicon is not installed; run `python -m nltk.downloader vader_lexicon`.")
+    os.environ["FEATURE_ENGINE"] = engine
+
+    with open(os.path.join(ROOT, "data", "generated_campaign.json")) as f:
+        campaign = {"Insights": [], "Campaigns": [json.load(f)]}
+
+    results = []
+    for size in sizes:
+        payload = make_payload(size, reviews, hourly)
+        client = _stub_server(payload, campaign, gemini_latency)
+        functions = _stage_functions(payload, engine, client)
+        for name in stages:
+            fn = functions[name]
+            fn()  # warm-up: imports, lazy initialisation, first-call caches
+            timings = []
+            for _ in range(runs):
+                start = time.perf_counter()
+                fn()
+                timings.append(time.perf_counter() - start)
+            summary = _summarize(timings, size)
+            summary["peak_mib"] = _peak_memory(fn)
+            results.append(dict(stage=name, stores=size, **summary))
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Return the (stage, stores, baseline_ms, current_ms) entries whose p50 regressed beyond tolerance."""
+    previous = {(r["stage"], r["stores"]): r for r in baseline["results"]}
+    regressions = []
+    for result in results:
+        old = previous.get((result["stage"], result["stores"]))
+        if old and result["p50_ms"] > old["p50_ms"] * (1 + tolerance):
+            regressions.append((result["stage"], result["stores"], old["p50_ms"], result["p50_ms"]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark pipeline stages and /recommend offline.")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="Comma-separated store counts.")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--reviews", type=int, default=5, help="Reviews per store.")
+    parser.add_argument("--engine", choices=("pandas", "numpy"), default="pandas")
+    parser.add_argument("--hourly", action="store_true", help="Include the hourly forecast.")
+    parser.add_argument("--stages", default=",".join(STAGES), help="Comma-separated stages to run.")
+    parser.add_argument("--gemini-latency-ms", type=float, default=0, help="Latency added to each stubbed Gemini call.")
+    parser.add_argument("--json", action="store_true", help="Print a machine-readable report.")
+    parser.add_argument("--output", help="Also write the JSON report to this file.")
+    parser.add_argument("--compare", help="Baseline JSON report to check for regressions.")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(",") if size]
+    stages = [stage for stage in args.stages.split(",") if stage]
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        parser.error(f"Unknown stages: {', '.join(sorted(unknown))}")
+
+    warnings.filterwarnings("ignore")
+    results = run(sizes, args.runs, args.reviews, args.engine, args.hourly,
+                  args.gemini_latency_ms / 1000, stages)
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "engine": args.engine,
+        "runs": args.runs,
+        "reviews_per_store": args.reviews,
+        "hourly": args.hourly,
+        "gemini_latency_ms": args.gemini_latency_ms,
+        "results": results
+    }
+
+    regressions = []
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        report["regressions"] = [
+            {"stage": stage, "stores": stores, "baseline_p50_ms": old, "p50_ms": new}
+            for stage, stores, old, new in regressions
+        ]
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"{'stage':<24} {'stores':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'stores/s':>10} {'peak MiB':>9}")
+        for r in results:
+            print(f"{r['stage']:<24} {r['stores']:>6} {r['p50_ms']:>9.2f} {r['p95_ms']:>9.2f} "
+                  f"{r['p99_ms']:>9.2f} {r['stores_per_s']:>10.0f} {r['peak_mib']:>9.2f}")
+        for stage, stores, old, new in regressions:
+            print(f"REGRESSION {stage} @ {stores} stores: p50 {old:.2f} ms -> {new:.2f} ms")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,28 +1,123 @@
 import os
 import logging
-from flask import Flask, request, jsonify
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS  # Import flask-cors
 import json
-import google.generativeai as genai
 from datetime import datetime, timedelta
-from src.fetch_data import fetch_data
-from src.cleaning import load_json_data, clean_store_data, clean_weather_data
-from src.feature_extraction import process_store_data
-from src.weather_features import process_weather_data
-from src.feature_pipeline import build_feature_vector
-from src.sentiment import compute_store_sentiment
+from src.fetch_data import (BatchFetcher, fetch_data, fetch_data_stream, catalog_stats,
+                            geocode_cache_stats, places_cache_stats, weather_cache_stats)
+from src import artifacts, bulkhead, http_client, metrics, prewarm, prompts, recommendation_cache, transport
+from src.sentiment import sentiment_cache_stats
+from src.bulkhead import BulkheadRejected
+from src.single_flight import SingleFlight
 
 from dotenv import load_dotenv
 load_dotenv()  # Load environment variables from .env file
 
+# Heavy modules (pandas, scikit-learn, nltk, google.generativeai) are not
+# imported here so the server starts and answers health checks quickly. They
+# are loaded by warm_up(): in a background thread at startup ("background",
+# the default), synchronously at import ("eager"), or on first use ("off").
+WARMUP_MODE = os.getenv("WARMUP_MODE", "background").lower()
+
+# Batch recommendations: maximum items per request and how many item
+# pipelines (feature build + Gemini calls) run at the same time.
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "1000"))
+BATCH_MAX_WORKERS = int(os.getenv("BATCH_MAX_WORKERS", "4"))
+
+# Recommendation modes: "refined" runs the generator and the marketing-expert
+# pass; "fast" makes a single schema-constrained Gemini call.
+RECOMMENDATION_MODES = ("refined", "fast")
+
+# Concurrent identical /recommend requests (same normalized zipcode, store type,
+# mode and bypass_cache) share one pipeline run unless COALESCE_REQUESTS is off.
+COALESCE_REQUESTS = os.getenv("COALESCE_REQUESTS", "true").lower() in ("1", "true", "yes")
+_recommend_flight = SingleFlight()
+
+# Aggregate Places results page by page as they arrive (src/market_stream.py)
+# instead of buffering the whole market first. Memory then stays bounded by the
+# page size, but per-store artifacts (cleaned/processed stores) are not written.
+STREAM_STORES = os.getenv("STREAM_STORES", "false").lower() in ("1", "true", "yes")
+
+# Recent /recommend traffic, from which the prewarm worker derives hot markets
+# (see src/prewarm.py; PREWARM_MODE=worker starts it).
+_traffic = prewarm.TrafficTracker()
+
+# Time budget for one recommendation, in seconds. Gemini calls that could not
+# get a bulkhead slot within what is left of it are shed with a 503.
+REQUEST_DEADLINE = float(os.getenv("REQUEST_DEADLINE", "30"))
+
+# Response schema for fast mode, matching the JSON structure requested in the prompt.
+CAMPAIGN_RESPONSE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "Insights": {"type": "array", "items": {"type": "string"}},
+        "Campaigns": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "Campaign Title": {"type": "string"},
+                    "Campaign Description": {"type": "string"},
+                    "Campaign Duration": {"type": "string"},
+                    "Discount/Promo": {"type": "string"}
+                },
+                "required": ["Campaign Title", "Campaign Description", "Campaign Duration", "Discount/Promo"]
+            }
+        }
+    },
+    "required": ["Insights", "Campaigns"]
+}
+
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
 app.logger.setLevel(logging.INFO)
 
-# Configure Gemini API Key
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+_genai = None
+_warmup_done = threading.Event()
+# Set when warm-up fails (e.g. the VADER lexicon is not installed); /ready then reports it.
+_warmup_error = None
+
+def get_genai():
+    """Import google.generativeai and configure the Gemini API key on first use."""
+    global _genai
+    if _genai is None:
+        import google.generativeai as genai
+        genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+        _genai = genai
+    return _genai
+
+def warm_up():
+    """
+    Load the heavy request-path modules and local resources ahead of the first request.
+    
+    Resource checks only look at the local NLTK data path; nothing is fetched
+    over the network.
+    """
+    global _warmup_error
+    start = time.perf_counter()
+    try:
+        import src.feature_pipeline  # noqa: F401  (pandas, numpy, scikit-learn)
+        from src.sentiment import get_analyzer
+        get_genai()
+        get_analyzer()
+    except Exception as e:
+        _warmup_error = f"{type(e).__name__}: {e}"
+        app.logger.error(f"Warm-up failed: {e}")
+    else:
+        app.logger.info(f"Warm-up finished in {time.perf_counter() - start:.2f}s.")
+    finally:
+        _warmup_done.set()
+
+if WARMUP_MODE == "eager":
+    warm_up()
+elif WARMUP_MODE == "background":
+    threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
 
 def get_current_context():
     """Get current date, time, and contextual information for real-time campaigns."""
@@ -70,129 +165,260 @@ def healthcheck():
     # You can include additional checks here if needed (e.g., database connectivity)
     return jsonify({"status": "healthy"}), 200
 
+@app.route('/ready', methods=['GET'])
+def readiness():
+    """
+    Reports whether warm-up has finished; use this when traffic should wait for a warm worker.
+    A failed warm-up keeps returning 503 with the error, since requests would fail the same way.
+    """
+    if WARMUP_MODE != "off" and not _warmup_done.is_set():
+        return jsonify({"status": "warming_up"}), 503
+    if _warmup_error is not None:
+        return jsonify({"status": "failed", "error": _warmup_error}), 503
+    return jsonify({"status": "ready"}), 200
+
+def _overloaded_body(error):
+    return {"error": "Service overloaded, retry later", "dependency": error.name, "retry_after": error.retry_after}
+
+def _json_response(body, status):
+    """jsonify a pipeline result, adding Retry-After to load-shedding 503s."""
+    response = jsonify(body)
+    response.status_code = status
+    if status == 503 and isinstance(body, dict) and "retry_after" in body:
+        response.headers['Retry-After'] = str(body["retry_after"])
+    return response
+
+@app.errorhandler(BulkheadRejected)
+def handle_overload(error):
+    app.logger.warning(f"Shedding request: {error}")
+    return _json_response(_overloaded_body(error), 503)
+
+def _cache_stats():
+    geocode = geocode_cache_stats()
+    return {
+        "geocode_memory": geocode["memory"],
+        "geocode_persistent": geocode["persistent"],
+        "places": places_cache_stats(),
+        "catalog": catalog_stats(),
+        "weather": weather_cache_stats(),
+        "sentiment": sentiment_cache_stats(),
+        "recommendation": recommendation_cache.recommendation_cache_stats()
+    }
+
+# Counters kept by the caches, HTTP client, bulkheads and so on are read when
+# /metrics is scraped rather than duplicated on the request path.
+metrics.register_stats("cache", _cache_stats, "cache")
+metrics.register_stats("upstream_http", http_client.host_stats, "host", {"status_codes": "status"})
+metrics.register_stats("bulkhead", bulkhead.bulkhead_stats, "dependency", {"rejected": "reason"})
+metrics.register_stats("coalescing", lambda: {"recommend": _recommend_flight.stats()}, "endpoint")
+metrics.register_stats("gemini_usage", prompts.token_stats, "call")
+metrics.register_stats("artifacts", lambda: {"writer": artifacts.artifact_stats()}, "sink")
+metrics.register_stats("transport", lambda: {transport.UPSTREAM_MODE: transport.transport_stats()}, "mode")
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Prometheus text exposition of stage timers, payload sizes, upstream status codes and cache counters."""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+def _record_traffic(zipcode, store_type):
+    """Count a request towards the hot markets, unless it was sent by the prewarm CLI."""
+    # prewarm=1 marks calls from the prewarm CLI, which must not count as traffic
+    # or they would keep their own markets hot.
+    if request.args.get('prewarm', '').lower() not in ('1', 'true', 'yes'):
+        _traffic.record(zipcode, store_type)
+
 @app.route('/recommend', methods=['GET'])
 def recommend_campaign():
     zipcode = request.args.get('zipcode')
     store_type = request.args.get('store_type')
+    # bypass_cache=true skips the recommendation cache lookup (the fresh result is still cached)
+    bypass_cache = request.args.get('bypass_cache', '').lower() in ('1', 'true', 'yes')
+    mode = request.args.get('mode', 'refined').lower()
     
     if not zipcode or not store_type:
         app.logger.error("Missing required parameters 'zipcode' and/or 'store_type'.")
         return jsonify({"error": "Missing required parameters 'zipcode' and/or 'store_type'."}), 400
+    if mode not in RECOMMENDATION_MODES:
+        return jsonify({"error": "Parameter 'mode' must be 'refined' or 'fast'."}), 400
+
+    app.logger.info(f"Received request for zipcode: {zipcode}, store_type: {store_type}, mode: {mode}")
+    _record_traffic(zipcode, store_type)
+    
+    if not COALESCE_REQUESTS:
+        result, status = generate_recommendation(zipcode, store_type, bypass_cache=bypass_cache, mode=mode)
+        return _json_response(result, status)
+
+    key = (zipcode.strip(), store_type.strip().lower(), mode, bypass_cache)
+    (result, status), shared = _recommend_flight.do(
+        key, generate_recommendation, zipcode.strip(), store_type.strip(), bypass_cache=bypass_cache, mode=mode
+    )
+    if shared:
+        app.logger.info(f"Coalesced with an in-flight request for zipcode: {zipcode}, store_type: {store_type}")
+    return _json_response(result, status)
+
+def coalescing_stats():
+    """Returns single-flight counters for /recommend (executions, coalesced waiters, keys in flight)."""
+    return _recommend_flight.stats()
+
+@app.route('/recommend/stream', methods=['GET'])
+def recommend_campaign_stream():
+    """
+    Streaming variant of /recommend. Sends the feature vector as soon as it is
+    built, then the initial campaign, then the refined campaign, so clients can
+    render progressively. Uses Server-Sent Events by default; pass format=ndjson
+    for newline-delimited JSON ({"event": ..., "status": ..., "data": ...} per line).
+    """
+    zipcode = request.args.get('zipcode')
+    store_type = request.args.get('store_type')
+    bypass_cache = request.args.get('bypass_cache', '').lower() in ('1', 'true', 'yes')
+    mode = request.args.get('mode', 'refined').lower()
+    stream_format = request.args.get('format', 'sse').lower()
 
-    app.logger.info(f"Received request for zipcode: {zipcode}, store_type: {store_type}")
+    if not zipcode or not store_type:
+        app.logger.error("Missing required parameters 'zipcode' and/or 'store_type'.")
+        return jsonify({"error": "Missing required parameters 'zipcode' and/or 'store_type'."}), 400
+    if mode not in RECOMMENDATION_MODES:
+        return jsonify({"error": "Parameter 'mode' must be 'refined' or 'fast'."}), 400
+    if stream_format not in ('sse', 'ndjson'):
+        return jsonify({"error": "Parameter 'format' must be 'sse' or 'ndjson'."}), 400
+
+    app.logger.info(f"Received streaming request for zipcode: {zipcode}, store_type: {store_type}")
+    _record_traffic(zipcode, store_type)
+
+    def generate():
+        events = iter_recommendation_events(zipcode, store_type, bypass_cache=bypass_cache, mode=mode)
+        for event, body, status in events:
+            if stream_format == 'ndjson':
+                yield json.dumps({"event": event, "status": status, "data": body}) + "\n"
+            else:
+                yield f"event: {event}\ndata: {json.dumps(body)}\n\n"
+
+    mimetype = 'application/x-ndjson' if stream_format == 'ndjson' else 'text/event-stream'
+    response = Response(stream_with_context(generate()), mimetype=mimetype)
+    # Ask proxies not to buffer the stream so each event reaches the client immediately.
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+def generate_recommendation(zipcode, store_type, data=None, bypass_cache=False, mode="refined"):
+    """
+    Run the full recommendation pipeline for one zipcode and store type:
+    fetch upstream data, build features and run the Gemini pass(es) for mode.
     
+    Pass data to reuse a payload already returned by fetch_data (e.g. from a batch
+    prefetch). Returns a (response_body, http_status) tuple.
+    """
+    with metrics.stage("total"):
+        for event, body, status in iter_recommendation_events(zipcode, store_type, data=data,
+                                                              bypass_cache=bypass_cache, mode=mode):
+            if event in ("campaign", "error"):
+                return body, status
+    return {"error": "Recommendation pipeline produced no result"}, 500
+
+def iter_recommendation_events(zipcode, store_type, data=None, bypass_cache=False, mode="refined"):
+    """
+    Run the recommendation pipeline, yielding (event, body, http_status) tuples as
+    each stage completes:
+      - "feature_vector": the market feature vector, as soon as it is built.
+      - "initial_campaign": the first-pass Gemini campaign, as soon as it parses
+        (refined mode only).
+      - "campaign": the final (expert-refined or cached) campaign. Last event.
+      - "error": a failure; body is the error payload. Last event.
+    """
     # Get current context for real-time campaigns
     context = get_current_context()
+    deadline = time.monotonic() + REQUEST_DEADLINE
     
-    data = fetch_data(zipcode, store_type)
-    app.logger.info("Data fetched successfully.")
-
-    stores = data.get('stores', [])
-    cleaned_stores = clean_store_data(stores)
-    processed_stores, aggregated_metrics = process_store_data(stores)
-    app.logger.info("Store data processed.")
+    # Imported here rather than at module level to keep server start-up light.
+    from src.feature_pipeline import build_pipeline_context
 
-    weather = data.get('weather', {})
-    cleaned_weather = clean_weather_data(weather)
-    weather_features = process_weather_data(weather)
-    app.logger.info("Weather data processed.")
+    stream = data is None and STREAM_STORES
+    if data is None:
+        try:
+            with metrics.stage("fetch"):
+                data = fetch_data_stream(zipcode, store_type) if stream else fetch_data(zipcode, store_type)
+        except BulkheadRejected as e:
+            app.logger.warning(f"Shedding request: {e}")
+            yield "error", _overloaded_body(e), 503
+            return
+    app.logger.info("Data fetched successfully.")
 
-    feature_vector = build_feature_vector(data)
-    store_sentiment = compute_store_sentiment(stores)
-    feature_vector['store_sentiment'] = store_sentiment
+    try:
+        with metrics.stage("features"):
+            if stream:
+                # Pages are fetched while earlier ones are aggregated.
+                from src.market_stream import build_streaming_context
+                pipeline = build_streaming_context(data)
+            else:
+                pipeline = build_pipeline_context(data)
+    except BulkheadRejected as e:
+        app.logger.warning(f"Shedding request: {e}")
+        yield "error", _overloaded_body(e), 503
+        return
+    cleaned_stores = pipeline['cleaned_stores']
+    processed_stores = pipeline['processed_stores']
+    aggregated_metrics = pipeline['aggregated_metrics']
+    cleaned_weather = pipeline['cleaned_weather']
+    weather_features = pipeline['weather_features']
+    store_sentiment = pipeline['store_sentiment']
+    feature_vector = pipeline['feature_vector']
     app.logger.info("Feature vector built.")
-
-    # Save intermediate data (optional)
-    os.makedirs('data', exist_ok=True)
-    cleaned_stores.to_json('data/cleaned_stores.json', orient='records', indent=2)
-    cleaned_weather.to_json('data/cleaned_weather.json', orient='records', indent=2)
-    processed_stores.to_json('data/processed_stores.json', orient='records', indent=2)
-    with open('data/aggregated_metrics.json', 'w') as f:
-        json.dump(aggregated_metrics, f, indent=2)
-    with open('data/weather_features.json', 'w') as f:
-        json.dump(weather_features, f, indent=2)
-    with open('data/feature_vector.json', 'w') as f:
-        json.dump(feature_vector, f, indent=2)
-
-    # Enhanced prompt with real-time context and 7-day forecast
-    marketing_prompt = f"""
-You are a strategic marketing consultant with deep insights into local market dynamics. Your task is to generate a concise, poster-ready marketing campaign recommendation for a local store based on the provided JSON data and current real-time context. The recommendation should be visually appealing, succinct, and output in valid JSON format only (without any additional text).
-
-CURRENT REAL-TIME CONTEXT:
-- Current Date: {context['current_date']}
-- Current Time: {context['current_time']}
-- Current Day: {context['current_day']}
-- Time Context: {context['time_context']}
-- Day Context: {context['day_context']}
-- Tomorrow: {context['tomorrow']}
-- This Weekend: {context['this_weekend_start']} - {context['this_weekend_end']}
-- Next Week Start: {context['next_week_start']}
-
-IMPORTANT: Use these current dates for your campaign durations. Do NOT use past dates or hardcoded dates like "November 2024". Use the current date context provided above.
-
-The JSON data you will use includes:
-- "store_counts": Number of nearby competitor stores by category (e.g., clothing_store, book_store, grocery_store, etc.).
-- "avg_ratings": Average customer ratings for each store category.
-- "spatial_density": Indicator of how clustered competitor stores are.
-- "centroid": Geographic center coordinates for the market.
-- "weather": 7-day daily forecast (max/min temp, precipitation, weather code) and summary stats (avg_max_temp, avg_min_temp, total_precip).
-- "hour_of_day" and "day_of_week": The current temporal context for time-sensitive promotions.
-- "store_sentiment": Customer sentiment analysis and scores for each store category.
-- "campaign_suitability_score": A metric indicating overall campaign readiness.
-
-Output your recommendation using the following JSON structure exactly and give output in json format without any additional text:
-
-{{
-  "Insights": [
-    "Insight 1: Based on the 7-day weather forecast and time context",
-    "Insight 2: Based on local competition analysis",
-    "Insight 3: Based on spatial density and market saturation",
-    "Insight 4: Based on customer ratings and sentiment analysis",
-    "Insight 5: Based on consumer behavior patterns for the week"
-  ],
-  "Campaigns": [
-    {{
-      "Campaign Title": "Create a compelling, time-relevant campaign title for a specific day or period in the next 7 days",
-      "Campaign Description": "Write a 2-3 sentence description that leverages the 7-day weather forecast, time, and market conditions",
-      "Campaign Duration": "Use dates from the next 7 days (e.g., 'June 22, 2024 - June 28, 2024')",
-      "Discount/Promo": "Create a relevant promotional offer based on the 7-day forecast and market context"
-    }},
-    {{
-      "Campaign Title": "Create a second compelling campaign title for another day or period in the next 7 days",
-      "Campaign Description": "Write a 2-3 sentence description targeting another aspect of the 7-day forecast and market conditions",
-      "Campaign Duration": "Use dates from the next 7 days",
-      "Discount/Promo": "Create another relevant promotional offer"
-    }}
-  ]
-}}
-
-CRITICAL REQUIREMENTS:
-1. Use ONLY dates from the next 7 days for campaign durations
-2. Make campaigns relevant to the weather and market context for specific days in the upcoming week
-3. Consider the 7-day weather forecast in your recommendations
-4. Base insights on the actual data provided
-5. Ensure all dates are current and realistic
-6. Keep campaign descriptions to 2-3 sentences maximum
-
-Generate at least two campaign recommendations in JSON Format as above with distinct insights based on the provided JSON data and 7-day context.
-
-JSON Data:
-{json.dumps(feature_vector, indent=2)}
-"""
+    yield "feature_vector", feature_vector, 200
+
+    # Save intermediate data (optional); written in the background per ARTIFACT_MODE.
+    # Streamed markets have no per-store artifacts.
+    artifacts.submit(artifacts.new_request_id(), {name: value for name, value in {
+        'cleaned_stores': cleaned_stores,
+        'cleaned_weather': cleaned_weather,
+        'processed_stores': processed_stores,
+        'aggregated_metrics': aggregated_metrics,
+        'weather_features': weather_features,
+        'feature_vector': feature_vector
+    }.items() if value is not None})
+
+    cache_key = recommendation_cache.fingerprint(feature_vector, store_type, mode=mode)
+    if not bypass_cache:
+        cached_campaign = recommendation_cache.get(cache_key)
+        if cached_campaign is not None:
+            app.logger.info("Returning cached recommendation.")
+            yield "campaign", cached_campaign, 200
+            return
+
+    # Enhanced prompt with real-time context and 7-day forecast, compacted to the token budget
+    marketing_prompt, prompt_tokens = prompts.build_marketing_prompt(context, feature_vector)
+    app.logger.info(f"Marketing prompt: ~{prompt_tokens} tokens.")
 
     app.logger.info("Sending prompt to Gemini with JSON response format.")
 
     try:
         # Initialize Gemini model
+        genai = get_genai()
         model = genai.GenerativeModel('gemini-1.5-flash')
+
+        if mode == "fast":
+            # Single call with a response schema and JSON MIME type, so the output
+            # parses directly and no refinement pass is needed.
+            response = _generate(model, "fast", marketing_prompt, deadline, genai.types.GenerationConfig(
+                temperature=0.7,
+                response_mime_type="application/json",
+                response_schema=CAMPAIGN_RESPONSE_SCHEMA
+            ))
+            try:
+                campaign_data = json.loads(response.text)
+            except json.JSONDecodeError as e:
+                app.logger.error(f"Failed to parse JSON from fast-mode Gemini call: {e}")
+                app.logger.error(f"Raw response: {response.text}")
+                yield "error", {"error": "Invalid JSON format from Gemini call", "details": str(e)}, 500
+                return
+            if not feature_vector.get("partial"):
+                recommendation_cache.put(cache_key, campaign_data)
+            yield "campaign", campaign_data, 200
+            return
         
         # First Gemini call - Generate initial recommendations
-        response = model.generate_content(
-            marketing_prompt,
-            generation_config=genai.types.GenerationConfig(
-                temperature=0.7
-            )
-        )
+        response = _generate(model, "generator", marketing_prompt, deadline, genai.types.GenerationConfig(
+            temperature=0.7
+        ))
         
         initial_campaign_content = response.text
         app.logger.error(f"Raw Gemini response (initial): {initial_campaign_content}")
@@ -205,64 +431,36 @@ JSON Data:
             app.logger.error(f"Extracted JSON substring (manual): {repr(json_str)[:200]}")
         else:
             app.logger.error("Could not find JSON object in Gemini response.")
-            return jsonify({"error": "Could not find JSON object in Gemini response."}), 500
+            yield "error", {"error": "Could not find JSON object in Gemini response."}, 500
+            return
 
         try:
             initial_campaign_data = json.loads(json_str)
         except json.JSONDecodeError as e:
             app.logger.error(f"Failed to parse JSON from initial Gemini call: {e}")
             app.logger.error(f"Raw response: {json_str}")
-            return jsonify({"error": "Invalid JSON format from initial Gemini call", "details": str(e)}), 500
+            yield "error", {"error": "Invalid JSON format from initial Gemini call", "details": str(e)}, 500
+            return
+
+        yield "initial_campaign", initial_campaign_data, 200
 
         # Second Gemini call - Marketing expert validation and improvement
-        marketing_expert_prompt = f"""
-You are a senior marketing expert with 15+ years of experience in retail marketing, consumer psychology, and campaign optimization. Your role is to analyze and improve marketing campaign recommendations to make them more realistic, compelling, and effective.
-
-CURRENT CONTEXT:
-- Current Date: {context['current_date']}
-- Store Type: {store_type}
-- Location: {zipcode}
-
-RAW CLEANED DATA FOR ANALYSIS:
-Store Data: {json.dumps(aggregated_metrics, indent=2)}
-Weather Data: {json.dumps(weather_features, indent=2)}
-Store Sentiment: {json.dumps(store_sentiment, indent=2)}
-
-ANALYZE THE FOLLOWING INITIAL CAMPAIGN RECOMMENDATIONS:
-{json.dumps(initial_campaign_data, indent=2)}
-
-MARKETING EXPERT TASK:
-1. **Realism Check**: Ensure campaigns are realistic for the store type and market conditions
-2. **Consumer Psychology**: Make recommendations more psychologically compelling
-3. **Competitive Edge**: Ensure campaigns stand out from typical local promotions
-4. **Actionability**: Make campaigns more actionable and measurable
-5. **Seasonal Relevance**: Ensure weather and seasonal factors are properly leveraged
-6. **Local Market Fit**: Adapt to local consumer behavior patterns
-
-IMPROVEMENT GUIDELINES:
-- Make campaign titles more catchy and memorable
-- Ensure promotional offers are realistic and profitable
-- Add specific timing strategies based on weather patterns
-- Include psychological triggers (urgency, scarcity, social proof)
-- Make descriptions more compelling and benefit-focused (2-3 sentences maximum)
-- Ensure insights are actionable and data-driven based on the provided raw data
-- Use actual data from the raw cleaned data to create specific, actionable insights
-
-OUTPUT FORMAT:
-Return the improved campaign recommendations in the same JSON structure, but with enhanced content that addresses the above criteria. Focus on making the campaigns more realistic, compelling, and effective for real-world implementation.
-
-CRITICAL: Use the actual data provided above to create specific insights. Do not mention "data needed" - use the real data available.
-
-Return only valid JSON without any additional text.
-"""
+        marketing_expert_prompt, prompt_tokens = prompts.build_expert_prompt(
+            context, zipcode, store_type, aggregated_metrics, weather_features,
+            store_sentiment, initial_campaign_data
+        )
+        app.logger.info(f"Marketing expert prompt: ~{prompt_tokens} tokens.")
 
         # Second Gemini call for marketing expert validation
-        expert_response = model.generate_content(
-            marketing_expert_prompt,
-            generation_config=genai.types.GenerationConfig(
-                temperature=0.8
-            )
-        )
+        try:
+            expert_response = _generate(model, "expert", marketing_expert_prompt, deadline,
+                                        genai.types.GenerationConfig(temperature=0.8))
+        except BulkheadRejected as e:
+            # The initial campaign is already usable; return it rather than shedding
+            # the whole request, but do not cache it as the refined result.
+            app.logger.warning(f"Skipping marketing expert pass: {e}")
+            yield "campaign", initial_campaign_data, 200
+            return
         
         final_campaign_content = expert_response.text
 
@@ -275,12 +473,142 @@ Return only valid JSON without any additional text.
             app.logger.warning("Falling back to initial recommendations due to expert validation failure")
             final_campaign_data = initial_campaign_data
 
-        # Return the final improved recommendations
-        return jsonify(final_campaign_data)
+        # Return the final improved recommendations; those built from a partial
+        # store list are not cached, so the next request retries Places.
+        if not feature_vector.get("partial"):
+            recommendation_cache.put(cache_key, final_campaign_data)
+        yield "campaign", final_campaign_data, 200
 
+    except BulkheadRejected as e:
+        app.logger.warning(f"Shedding request: {e}")
+        yield "error", _overloaded_body(e), 503
     except Exception as e:
         app.logger.error(f"Gemini API request failed: {e}")
-        return jsonify({"error": "Gemini API request failed", "details": str(e)}), 500
+        yield "error", {"error": "Gemini API request failed", "details": str(e)}, 500
+
+def _generate(model, call, prompt, deadline, generation_config):
+    """Run one Gemini call inside the Gemini bulkhead, recording its latency, outcome and token usage."""
+    try:
+        with bulkhead.get("gemini").slot(deadline), metrics.stage(f"gemini_{call}"):
+            response = transport.generate_content(model, call, prompt, generation_config)
+    except BulkheadRejected:
+        metrics.GEMINI_CALLS.inc(call, "rejected")
+        raise
+    except Exception:
+        metrics.GEMINI_CALLS.inc(call, "error")
+        raise
+    metrics.GEMINI_CALLS.inc(call, "ok")
+    app.logger.info(f"Gemini token usage: {prompts.record_usage(call, prompt, response)}")
+    return response
+
+def recommend_batch(pairs, bypass_cache=False, max_workers=None, mode="refined"):
+    """
+    Generate recommendations for many (zipcode, store_type) pairs.
+    
+    Upstream lookups are deduplicated across the batch (see BatchFetcher) and
+    each distinct pair runs its pipeline once, with at most max_workers
+    (default BATCH_MAX_WORKERS) pipelines in flight. Yields one dict per input
+    pair, in completion order:
+      {"index": i, "zipcode": ..., "store_type": ..., "status": 200, "result": {...}}
+    """
+    pairs = [(str(zipcode).strip(), str(store_type).strip()) for zipcode, store_type in pairs]
+    indexes = {}
+    for i, pair in enumerate(pairs):
+        indexes.setdefault(pair, []).append(i)
+
+    fetcher = BatchFetcher()
+
+    def run(pair):
+        try:
+            data = fetcher.fetch(*pair)
+            return generate_recommendation(pair[0], pair[1], data=data, bypass_cache=bypass_cache, mode=mode)
+        except BulkheadRejected as e:
+            app.logger.warning(f"Batch item {pair} shed: {e}")
+            return _overloaded_body(e), 503
+        except Exception as e:
+            app.logger.error(f"Batch item {pair} failed: {e}")
+            return {"error": "Recommendation failed", "details": str(e)}, 500
+
+    # Not a `with` block: if the client disconnects, the generator is closed and
+    # items that have not started yet must be cancelled rather than waited for.
+    executor = ThreadPoolExecutor(max_workers=max_workers or BATCH_MAX_WORKERS, thread_name_prefix="batch")
+    try:
+        futures = {executor.submit(run, pair): pair for pair in indexes}
+        for future in as_completed(futures):
+            pair = futures[future]
+            result, status = future.result()
+            for i in indexes[pair]:
+                yield {"index": i, "zipcode": pair[0], "store_type": pair[1], "status": status, "result": result}
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+@app.route('/recommend/batch', methods=['POST'])
+def recommend_campaign_batch():
+    """
+    Batch variant of /recommend. Accepts a JSON body of the form
+    {"items": [{"zipcode": "...", "store_type": "..."}, ...], "bypass_cache": false, "mode": "refined"}
+    (or just the list of items) and streams one NDJSON line per item as it finishes.
+    """
+    body = request.get_json(silent=True)
+    items = body.get('items') if isinstance(body, dict) else body
+    bypass_cache = bool(body.get('bypass_cache', False)) if isinstance(body, dict) else False
+    mode = str(body.get('mode', 'refined')).lower() if isinstance(body, dict) else 'refined'
+
+    if not isinstance(items, list) or not items:
+        return jsonify({"error": "Request body must contain a non-empty 'items' list."}), 400
+    if mode not in RECOMMENDATION_MODES:
+        return jsonify({"error": "Field 'mode' must be 'refined' or 'fast'."}), 400
+    if len(items) > BATCH_MAX_ITEMS:
+        return jsonify({"error": f"Too many items; the limit is {BATCH_MAX_ITEMS}."}), 400
+    for i, item in enumerate(items):
+        if not isinstance(item, dict) or not item.get('zipcode') or not item.get('store_type'):
+            return jsonify({"error": f"Item {i} is missing 'zipcode' and/or 'store_type'."}), 400
+
+    app.logger.info(f"Received batch request with {len(items)} items")
+    pairs = [(item['zipcode'], item['store_type']) for item in items]
+
+    def generate():
+        for line in recommend_batch(pairs, bypass_cache=bypass_cache, mode=mode):
+            yield json.dumps(line) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+def prewarm_market(zipcode, store_type):
+    """
+    Warm one market ahead of traffic. With PREWARM_TARGET=upstream only the
+    upstream caches are filled (geocode, Places, catalog, weather and review
+    sentiment scores); the request still builds its own feature vector.
+    Otherwise each of PREWARM_MODES runs the full recommendation pipeline,
+    coalesced with any identical live request.
+    """
+    if prewarm.PREWARM_TARGET == "upstream":
+        from src.sentiment import compute_store_sentiment
+        data = fetch_data(zipcode, store_type)
+        if "error" in data:
+            raise RuntimeError(data["error"])
+        compute_store_sentiment(data["stores"])
+        return
+    for mode in prewarm.PREWARM_MODES:
+        key = (zipcode, store_type, mode, False)
+        (result, status), _ = _recommend_flight.do(key, generate_recommendation, zipcode, store_type, mode=mode)
+        if status != 200:
+            raise RuntimeError(result.get("error", f"status {status}"))
+
+_prewarm_worker = prewarm.PrewarmWorker(prewarm_market, tracker=_traffic)
+metrics.register_stats("prewarm", lambda: {"worker": _prewarm_worker.stats()}, "scheduler")
+if prewarm.PREWARM_MODE == "worker":
+    _prewarm_worker.start()
+
+@app.route('/prewarm/keys', methods=['GET'])
+def prewarm_keys():
+    """The markets the next prewarm round would warm: keys file first, then the most requested pairs."""
+    limit = request.args.get('limit', type=int) or prewarm.PREWARM_TOP_N
+    counts = dict(_traffic.top(limit))
+    keys = prewarm.hot_keys(_traffic, top_n=limit)
+    return jsonify({"keys": [
+        {"zipcode": zipcode, "store_type": store_type, "requests": counts.get((zipcode, store_type), 0)}
+        for zipcode, store_type in keys
+    ]})
 
 # Run the Flask development server locally
 if __name__ == '__main__':
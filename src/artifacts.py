@@ -0,0 +1,152 @@
+import json
+import os
+import queue
+import random
+import re
+import shutil
+import threading
+import time
+import uuid
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Intermediate artifacts (cleaned stores, feature vector, ...) are written by a
+# background thread so disk I/O never happens on the request path.
+#   ARTIFACT_MODE: "off", "sampled" (a fraction of requests) or "always".
+#   ARTIFACT_SAMPLE_RATE: fraction of requests kept in "sampled" mode.
+#   ARTIFACT_DIR: root directory; each request gets its own sub-directory.
+#   ARTIFACT_QUEUE_SIZE: pending requests buffered before new ones are dropped.
+#   ARTIFACT_MAX_DIRS: request directories kept; after each write the oldest
+#     beyond this are deleted, so disk use stays bounded. 0 keeps everything.
+ARTIFACT_MODE = os.getenv("ARTIFACT_MODE", "sampled").lower()
+ARTIFACT_SAMPLE_RATE = float(os.getenv("ARTIFACT_SAMPLE_RATE", "0.05"))
+ARTIFACT_DIR = os.getenv("ARTIFACT_DIR", "data/artifacts")
+ARTIFACT_QUEUE_SIZE = int(os.getenv("ARTIFACT_QUEUE_SIZE", "64"))
+ARTIFACT_MAX_DIRS = int(os.getenv("ARTIFACT_MAX_DIRS", "500"))
+
+# Matches new_request_id(), so pruning never touches anything else in ARTIFACT_DIR.
+_REQUEST_ID = re.compile(r"^\d{8}T\d{6}-[0-9a-f]{8}$")
+
+_queue = queue.Queue(maxsize=ARTIFACT_QUEUE_SIZE)
+_worker = None
+_worker_lock = threading.Lock()
+_stats_lock = threading.Lock()
+_stats = {
+    "submitted": 0,
+    "sampled_out": 0,
+    "dropped": 0,
+    "written": 0,
+    "pruned": 0,
+    "errors": 0
+}
+
+
+def _count(name, amount=1):
+    with _stats_lock:
+        _stats[name] += amount
+
+
+def new_request_id():
+    """Returns a sortable, unique id used as the per-request artifact directory name."""
+    return f"{time.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}"
+
+
+def should_record():
+    """Decides whether the current request's artifacts are kept under ARTIFACT_MODE."""
+    if ARTIFACT_MODE == "always":
+        return True
+    if ARTIFACT_MODE == "sampled":
+        return random.random() < ARTIFACT_SAMPLE_RATE
+    return False
+
+
+def submit(request_id, artifacts):
+    """
+    Queue a request's artifacts for writing.
+
+    artifacts maps a name (used as the file name) to a DataFrame, a list of
+    records or any JSON-serializable value. Nothing is serialized here; if the
+    request is not sampled the call returns immediately, and if the queue is
+    full the artifacts are dropped and counted. Returns True when queued.
+    """
+    if not should_record():
+        _count("sampled_out")
+        return False
+    _ensure_worker()
+    try:
+        _queue.put_nowait((request_id, artifacts))
+    except queue.Full:
+        _count("dropped")
+        return False
+    _count("submitted")
+    return True
+
+
+def _ensure_worker():
+    global _worker
+    if _worker is None or not _worker.is_alive():
+        with _worker_lock:
+            if _worker is None or not _worker.is_alive():
+                _worker = threading.Thread(target=_run, name="artifact-writer", daemon=True)
+                _worker.start()
+
+
+def _run():
+    while True:
+        request_id, artifacts = _queue.get()
+        try:
+            _write(request_id, artifacts)
+            _prune()
+        except Exception as e:
+            print(f"Warning: failed to write artifacts for request {request_id}: {e}")
+            _count("errors")
+        finally:
+            _queue.task_done()
+
+
+def _write(request_id, artifacts):
+    directory = os.path.join(ARTIFACT_DIR, request_id)
+    os.makedirs(directory, exist_ok=True)
+    for name, value in artifacts.items():
+        path = os.path.join(directory, f"{name}.json")
+        tmp_path = path + ".tmp"
+        # Compact encoding; DataFrames use their own (compact) records writer.
+        if hasattr(value, "to_json"):
+            value.to_json(tmp_path, orient="records")
+        else:
+            with open(tmp_path, "w") as f:
+                json.dump(value, f, separators=(",", ":"), default=str)
+        os.replace(tmp_path, path)
+        _count("written")
+
+
+def _prune():
+    """Delete the oldest request directories beyond ARTIFACT_MAX_DIRS (request ids sort by creation time)."""
+    if ARTIFACT_MAX_DIRS <= 0:
+        return
+    names = sorted(name for name in os.listdir(ARTIFACT_DIR)
+                   if _REQUEST_ID.match(name) and os.path.isdir(os.path.join(ARTIFACT_DIR, name)))
+    for name in names[:-ARTIFACT_MAX_DIRS]:
+        shutil.rmtree(os.path.join(ARTIFACT_DIR, name), ignore_errors=True)
+        _count("pruned")
+
+
+def flush(timeout=None):
+    """Wait until every queued artifact has been written (or timeout seconds pass). Returns True if drained."""
+    deadline = time.monotonic() + timeout if timeout is not None else None
+    while _queue.unfinished_tasks:
+        if deadline is not None and time.monotonic() >= deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def artifact_stats():
+    """Returns artifact sink counters and the current queue depth."""
+    with _stats_lock:
+        stats = dict(_stats)
+    stats["queue_depth"] = _queue.qsize()
+    stats["mode"] = ARTIFACT_MODE
+    return stats
@@ -0,0 +1,183 @@
+import math
+import os
+import threading
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Per-dependency concurrency limits for outbound calls (Gemini, Google APIs).
+# Each dependency gets a number of concurrent slots and a bounded wait queue:
+#   BULKHEAD_<NAME>_CONCURRENCY: calls allowed in flight at once.
+#   BULKHEAD_<NAME>_QUEUE: callers allowed to wait for a slot; more are rejected.
+#   BULKHEAD_<NAME>_MAX_WAIT: longest a caller waits for a slot, in seconds.
+# A caller is also rejected straight away when the expected wait (queue position
+# times the recent average call time) would run past its deadline, so overload
+# turns into a fast 503 instead of a slow upstream 429.
+DEFAULTS = {
+    "gemini": {"concurrency": 8, "queue": 32, "max_wait": 10.0},
+    "google": {"concurrency": 16, "queue": 64, "max_wait": 5.0}
+}
+
+# Weight of the latest call in the moving average of call durations.
+SERVICE_TIME_ALPHA = 0.2
+
+
+class BulkheadRejected(Exception):
+    """Raised when a call is shed by a bulkhead; retry_after is a suggested delay in seconds."""
+
+    def __init__(self, name, reason, retry_after):
+        super().__init__(f"{name} is overloaded ({reason})")
+        self.name = name
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class Bulkhead:
+    """
+    Concurrency limit with a bounded wait queue for one upstream dependency.
+
+    Parameters:
+    - name: Dependency name, used in errors and stats.
+    - concurrency: Maximum number of calls inside the bulkhead at once.
+    - queue: Maximum number of callers waiting for a slot.
+    - max_wait: Maximum time in seconds a caller waits for a slot.
+
+    Use slot() as a context manager around the outbound call.
+    """
+
+    def __init__(self, name, concurrency, queue, max_wait):
+        self.name = name
+        self.concurrency = concurrency
+        self.queue = queue
+        self.max_wait = max_wait
+        self._cond = threading.Condition()
+        self._active = 0
+        self._waiting = 0
+        self._service_time = None
+        self.admitted = 0
+        self.rejected = {"queue_full": 0, "deadline": 0, "timeout": 0}
+        self.wait_seconds = 0.0
+        self.wait_seconds_max = 0.0
+
+    def _expected_wait(self):
+        # Callers ahead of us share the slots; each takes about one average call time.
+        if self._active < self.concurrency and not self._waiting:
+            return 0.0
+        service_time = self._service_time or 1.0
+        return (self._waiting // self.concurrency + 1) * service_time
+
+    def _reject(self, reason):
+        self.rejected[reason] += 1
+        retry_after = max(1, int(math.ceil(self._expected_wait())))
+        raise BulkheadRejected(self.name, reason, retry_after)
+
+    def acquire(self, deadline=None):
+        """
+        Wait for a slot. deadline is an absolute time.monotonic() value by which
+        the caller needs its answer. Raises BulkheadRejected when the queue is
+        full or no slot frees up in time.
+        """
+        start = time.monotonic()
+        limit = self.max_wait
+        if deadline is not None:
+            limit = min(limit, deadline - start)
+        with self._cond:
+            if self._active < self.concurrency and not self._waiting:
+                self._active += 1
+                self.admitted += 1
+                return
+            if self._waiting >= self.queue:
+                self._reject("queue_full")
+            if limit <= 0 or self._expected_wait() > limit:
+                self._reject("deadline")
+
+            self._waiting += 1
+            try:
+                end = start + limit
+                while self._active >= self.concurrency:
+                    remaining = end - time.monotonic()
+                    if remaining <= 0:
+                        self._reject("timeout")
+                    self._cond.wait(remaining)
+            finally:
+                self._waiting -= 1
+            self._active += 1
+            self.admitted += 1
+            waited = time.monotonic() - start
+            self.wait_seconds += waited
+            self.wait_seconds_max = max(self.wait_seconds_max, waited)
+
+    def release(self, duration=None):
+        """Free a slot; duration (seconds the call took) feeds the expected-wait estimate."""
+        with self._cond:
+            self._active -= 1
+            if duration is not None:
+                if self._service_time is None:
+                    self._service_time = duration
+                else:
+                    self._service_time += SERVICE_TIME_ALPHA * (duration - self._service_time)
+            self._cond.notify_all()
+
+    def slot(self, deadline=None):
+        return _Slot(self, deadline)
+
+    def stats(self):
+        """Return slot usage, queue depth, wait times and rejection counters."""
+        with self._cond:
+            return {
+                "concurrency": self.concurrency,
+                "queue_size": self.queue,
+                "active": self._active,
+                "queue_depth": self._waiting,
+                "admitted": self.admitted,
+                "rejected": dict(self.rejected),
+                "wait_seconds": self.wait_seconds,
+                "wait_seconds_max": self.wait_seconds_max,
+                "service_time_avg": self._service_time or 0.0
+            }
+
+
+class _Slot:
+    def __init__(self, bulkhead, deadline):
+        self.bulkhead = bulkhead
+        self.deadline = deadline
+
+    def __enter__(self):
+        self.bulkhead.acquire(self.deadline)
+        self.start = time.monotonic()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.bulkhead.release(time.monotonic() - self.start)
+        return False
+
+
+_bulkheads = {}
+_bulkheads_lock = threading.Lock()
+
+
+def get(name):
+    """Returns the shared bulkhead for a dependency, configured from BULKHEAD_<NAME>_* env vars."""
+    bulkhead = _bulkheads.get(name)
+    if bulkhead is None:
+        with _bulkheads_lock:
+            bulkhead = _bulkheads.get(name)
+            if bulkhead is None:
+                defaults = DEFAULTS.get(name, DEFAULTS["google"])
+                prefix = f"BULKHEAD_{name.upper()}_"
+                bulkhead = _bulkheads[name] = Bulkhead(
+                    name,
+                    concurrency=int(os.getenv(prefix + "CONCURRENCY", str(defaults["concurrency"]))),
+                    queue=int(os.getenv(prefix + "QUEUE", str(defaults["queue"]))),
+                    max_wait=float(os.getenv(prefix + "MAX_WAIT", str(defaults["max_wait"])))
+                )
+    return bulkhead
+
+
+def bulkhead_stats():
+    """Returns stats for every bulkhead created so far, keyed by dependency name."""
+    with _bulkheads_lock:
+        bulkheads = list(_bulkheads.values())
+    return {bulkhead.name: bulkhead.stats() for bulkhead in bulkheads}
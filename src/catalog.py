@@ -0,0 +1,222 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+class PlacesCatalog:
+    """
+    SQLite catalog of Places results, keyed by place id.
+
+    Each place is stored once with its normalized columns (name, address,
+    coordinates, primary type, types, rating), its reviews and the time it was
+    last seen in a search. A market (zipcode, store_type) records which places
+    its text search returned, in result order, and when it was last refreshed,
+    so a market that is still fresh is rebuilt from local rows without calling
+    Places or parsing its JSON payload.
+
+    Hit, miss and refresh counters are available through stats().
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self._connect()
+        conn.executescript(
+            "CREATE TABLE IF NOT EXISTS places ("
+            "place_id TEXT PRIMARY KEY, display_name TEXT, language_code TEXT, "
+            "formatted_address TEXT, primary_type TEXT, types TEXT, rating REAL, "
+            "latitude REAL, longitude REAL, reviews TEXT, last_seen REAL NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS idx_places_primary_type ON places(primary_type);"
+            "CREATE TABLE IF NOT EXISTS markets ("
+            "zipcode TEXT NOT NULL, store_type TEXT NOT NULL, refreshed_at REAL NOT NULL, "
+            "PRIMARY KEY (zipcode, store_type));"
+            "CREATE TABLE IF NOT EXISTS market_places ("
+            "zipcode TEXT NOT NULL, store_type TEXT NOT NULL, rank INTEGER NOT NULL, "
+            "place_id TEXT NOT NULL REFERENCES places(place_id), "
+            "PRIMARY KEY (zipcode, store_type, rank));"
+            "CREATE INDEX IF NOT EXISTS idx_market_places_zipcode ON market_places(zipcode);"
+            "CREATE INDEX IF NOT EXISTS idx_market_places_place_id ON market_places(place_id);"
+        )
+        conn.commit()
+
+    def _connect(self):
+        # sqlite3 connections cannot be shared between threads, so keep one per thread.
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def get_market(self, zipcode, store_type, max_age):
+        """
+        Return (places, refreshed_at) for a market refreshed less than max_age
+        seconds ago, or None when it is unknown or stale. places are rebuilt in
+        the shape of the Places API response.
+        """
+        try:
+            conn = self._connect()
+            market = conn.execute(
+                "SELECT refreshed_at FROM markets WHERE zipcode = ? AND store_type = ?", (zipcode, store_type)
+            ).fetchone()
+            if market is None or time.time() - market[0] > max_age:
+                self._count("misses")
+                return None
+            rows = conn.execute(
+                "SELECT p.place_id, p.display_name, p.language_code, p.formatted_address, p.primary_type, "
+                "p.types, p.rating, p.latitude, p.longitude, p.reviews "
+                "FROM market_places m JOIN places p ON p.place_id = m.place_id "
+                "WHERE m.zipcode = ? AND m.store_type = ? ORDER BY m.rank",
+                (zipcode, store_type)
+            ).fetchall()
+        except sqlite3.Error as e:
+            print(f"Warning: catalog read failed for {self.path}: {e}")
+            self._count("misses")
+            return None
+        self._count("hits")
+        return [_place_from_row(row) for row in rows], market[0]
+
+    def upsert_market(self, zipcode, store_type, places):
+        """
+        Store a fresh search result for a market: upsert its places and replace
+        its membership. The market is only marked refreshed when every place has
+        an id and every write succeeded; returns whether it was.
+        """
+        if not all(place.get("id") for place in places):
+            print(f"Warning: not cataloging {zipcode}/{store_type}: some places have no id")
+            return False
+        return self.upsert_places(places) and self.set_market(zipcode, store_type, [place["id"] for place in places])
+
+    def upsert_places(self, places):
+        """Insert or update places (e.g. one result page at a time). Returns False if the write failed."""
+        now = time.time()
+        rows = [_row_from_place(place, now) for place in places if place.get("id")]
+        try:
+            conn = self._connect()
+            with conn:
+                conn.executemany(
+                    "INSERT INTO places (place_id, display_name, language_code, formatted_address, primary_type, "
+                    "types, rating, latitude, longitude, reviews, last_seen) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT(place_id) DO UPDATE SET display_name = excluded.display_name, "
+                    "language_code = excluded.language_code, formatted_address = excluded.formatted_address, "
+                    "primary_type = excluded.primary_type, types = excluded.types, rating = excluded.rating, "
+                    "latitude = excluded.latitude, longitude = excluded.longitude, "
+                    "reviews = excluded.reviews, last_seen = excluded.last_seen",
+                    rows
+                )
+        except sqlite3.Error as e:
+            print(f"Warning: catalog write failed for {self.path}: {e}")
+            return False
+        return True
+
+    def set_market(self, zipcode, store_type, place_ids):
+        """
+        Replace a market's membership with place_ids (in result order) and mark it
+        refreshed now. Returns False, leaving the market as it was, when an id is
+        missing or the write failed.
+        """
+        place_ids = list(place_ids)
+        if not all(place_ids):
+            print(f"Warning: not cataloging {zipcode}/{store_type}: some places have no id")
+            return False
+        place_ids = list(dict.fromkeys(place_ids))
+        try:
+            conn = self._connect()
+            with conn:
+                conn.execute("DELETE FROM market_places WHERE zipcode = ? AND store_type = ?", (zipcode, store_type))
+                conn.executemany(
+                    "INSERT INTO market_places (zipcode, store_type, rank, place_id) VALUES (?, ?, ?, ?)",
+                    [(zipcode, store_type, rank, place_id) for rank, place_id in enumerate(place_ids)]
+                )
+                conn.execute(
+                    "INSERT OR REPLACE INTO markets (zipcode, store_type, refreshed_at) VALUES (?, ?, ?)",
+                    (zipcode, store_type, time.time())
+                )
+        except sqlite3.Error as e:
+            print(f"Warning: catalog write failed for {self.path}: {e}")
+            return False
+        self._count("refreshes")
+        return True
+
+    def invalidate(self, zipcode=None, store_type=None):
+        """Mark markets stale (all of them, or those matching zipcode and/or store_type). Returns the count."""
+        clauses, params = [], []
+        if zipcode is not None:
+            clauses.append("zipcode = ?")
+            params.append(zipcode)
+        if store_type is not None:
+            clauses.append("store_type = ?")
+            params.append(store_type)
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        conn = self._connect()
+        with conn:
+            return conn.execute(f"UPDATE markets SET refreshed_at = 0{where}", params).rowcount
+
+    def stats(self):
+        """Return hit/miss/refresh counters and the number of places and markets stored."""
+        conn = self._connect()
+        places = conn.execute("SELECT COUNT(*) FROM places").fetchone()[0]
+        markets = conn.execute("SELECT COUNT(*) FROM markets").fetchone()[0]
+        total = self.hits + self.misses
+        return {
+            "size": places,
+            "markets": markets,
+            "hits": self.hits,
+            "misses": self.misses,
+            "refreshes": self.refreshes,
+            "hit_rate": self.hits / total if total else 0.0
+        }
+
+
+def _row_from_place(place, now):
+    display_name = place.get("displayName") or {}
+    location = place.get("location") or {}
+    return (
+        place["id"],
+        display_name.get("text"),
+        display_name.get("languageCode"),
+        place.get("formattedAddress"),
+        place.get("primaryType"),
+        json.dumps(place["types"]) if "types" in place else None,
+        place.get("rating"),
+        location.get("latitude"),
+        location.get("longitude"),
+        json.dumps(place["reviews"]) if "reviews" in place else None,
+        now
+    )
+
+
+def _place_from_row(row):
+    """Rebuild a Places API place from a catalog row; fields that were absent stay absent."""
+    (place_id, display_name, language_code, formatted_address, primary_type,
+     types, rating, latitude, longitude, reviews) = row
+    place = {"id": place_id}
+    if display_name is not None:
+        place["displayName"] = {"text": display_name, "languageCode": language_code}
+    if formatted_address is not None:
+        place["formattedAddress"] = formatted_address
+    if latitude is not None and longitude is not None:
+        place["location"] = {"latitude": latitude, "longitude": longitude}
+    if primary_type is not None:
+        place["primaryType"] = primary_type
+    if types is not None:
+        place["types"] = json.loads(types)
+    if rating is not None:
+        place["rating"] = rating
+    if reviews is not None:
+        place["reviews"] = json.loads(reviews)
+    return place
@@ -64,7 +64,15 @@ def clean_store_data(stores):
     
     # Convert list of store dicts to DataFrame
     df = pd.json_normalize(stores)
+    return clean_store_frame(df)
+
+def clean_store_frame(df):
+    """
+    Clean a store DataFrame that has already been built with pd.json_normalize.
     
+    Lets callers that normalize the raw payload once reuse that frame; the
+    frame is modified in place and returned.
+    """
     # Handle empty DataFrame
     if df.empty:
         print("Warning: Empty DataFrame after normalization. Returning empty DataFrame.")
@@ -1,8 +1,9 @@
 import pandas as pd
 import numpy as np
 from sklearn.preprocessing import MultiLabelBinarizer, MinMaxScaler
+from src.spatial import spatial_features
 
-def process_store_data(stores, centroid=None, radius=0.01):
+def process_store_data(stores, centroid=None, radius_km=None, radii_km=None):
     """
     Process store data for feature extraction.
     
@@ -10,11 +11,16 @@ def process_store_data(stores, centroid=None, radius=0.01):
     - stores: list of store dictionaries.
     - centroid: Optional tuple (latitude, longitude) to calculate distances from.
                 If not provided, the centroid is computed as the mean of the store coordinates.
-    - radius: Radius (in the same coordinate units) to compute spatial density.
+    - radius_km: Radius in km around the centroid used for spatial density
+                 (defaults to SPATIAL_DENSITY_RADIUS_KM).
+    - radii_km: Radii in km for the multi-radius density features
+                (defaults to SPATIAL_DENSITY_RADII_KM).
     
     Returns:
-    - df: DataFrame with one-hot encoded store types, normalized ratings, and distance from centroid.
-    - aggregated_metrics: Dictionary with store counts per primary type, average ratings, spatial density, and centroid.
+    - df: DataFrame with one-hot encoded store types, normalized ratings, haversine distance
+          from the centroid, nearest-competitor distance and competitor counts per radius.
+    - aggregated_metrics: Dictionary with store counts per primary type, average ratings, spatial density,
+          centroid, and the centroid/competitor density and nearest-competitor summaries (see src/spatial.py).
     """
     # Handle empty stores list
     if not stores:
@@ -23,12 +29,23 @@ def process_store_data(stores, centroid=None, radius=0.01):
             'store_counts': {},
             'avg_ratings': {},
             'spatial_density': 0,
-            'centroid': (0, 0)
+            'centroid': (0, 0),
+            'centroid_density': {},
+            'competitor_density': {},
+            'nearest_competitor': {}
         }
     
     # Convert list of stores into a DataFrame
     df = pd.json_normalize(stores)
+    return process_store_frame(df, centroid=centroid, radius_km=radius_km, radii_km=radii_km)
+
+def process_store_frame(df, centroid=None, radius_km=None, radii_km=None):
+    """
+    Process a store DataFrame that has already been built with pd.json_normalize.
     
+    Same parameters and return values as process_store_data, for callers that
+    normalize the raw payload once and share the frame between steps.
+    """
     # Handle empty DataFrame
     if df.empty:
         print("Warning: Empty DataFrame after normalization. Returning empty DataFrame and default metrics.")
@@ -36,7 +53,10 @@ def process_store_data(stores, centroid=None, radius=0.01):
             'store_counts': {},
             'avg_ratings': {},
             'spatial_density': 0,
-            'centroid': (0, 0)
+            'centroid': (0, 0),
+            'centroid_density': {},
+            'competitor_density': {},
+            'nearest_competitor': {}
         }
     
     # Handle missing 'types' column
@@ -95,11 +115,13 @@ def process_store_data(stores, centroid=None, radius=0.01):
         centroid_lon = df['location.longitude'].mean()
         centroid = (centroid_lat, centroid_lon)
     
-    # Compute Euclidean distance from each store to the centroid.
-    # Note: For small areas, Euclidean distance is a simple approximation.
-    df['distance_from_centroid'] = np.sqrt(
-        (df['location.latitude'] - centroid[0])**2 + (df['location.longitude'] - centroid[1])**2
-    )
+    # Haversine distances (km) to the centroid and between stores.
+    spatial = spatial_features(df['location.latitude'].to_numpy(), df['location.longitude'].to_numpy(),
+                               centroid, radius_km=radius_km, radii_km=radii_km)
+    df['distance_from_centroid'] = spatial['distance_from_centroid']
+    df['nearest_competitor_km'] = spatial['nearest_competitor_km']
+    for label, counts in spatial['competitors_within'].items():
+        df[f'competitors_within_{label}'] = counts
     
     # Aggregated Store Metrics:
     # 1. Store Count per Primary Type
@@ -108,14 +130,17 @@ def process_store_data(stores, centroid=None, radius=0.01):
     # 2. Average Rating by Primary Type
     avg_ratings = df.groupby('primaryType')['rating'].mean().to_dict()
     
-    # 3. Spatial Density: count of stores within the specified radius from the centroid
-    spatial_density = df[df['distance_from_centroid'] <= radius].shape[0]
+    # 3. Spatial Density: count of stores within radius_km of the centroid
+    spatial_density = spatial['spatial_density']
     
     aggregated_metrics = {
         'store_counts': store_counts,
         'avg_ratings': avg_ratings,
         'spatial_density': spatial_density,
-        'centroid': centroid
+        'centroid': centroid,
+        'centroid_density': spatial['centroid_density'],
+        'competitor_density': spatial['competitor_density'],
+        'nearest_competitor': spatial['nearest_competitor']
     }
     
     return df, aggregated_metrics
@@ -1,8 +1,82 @@
 import datetime
-from src.feature_extraction import process_store_data
+import os
+import pandas as pd
+from src.cleaning import clean_store_data, clean_store_frame, clean_weather_data
+from src.feature_extraction import process_store_data, process_store_frame
+from src.numpy_features import clean_store_records, process_store_records
 from src.weather_features import process_weather_data
+from src.sentiment import compute_store_sentiment
+from src import metrics
 
-def build_feature_vector(data):
+# Store feature engine used on the request path: "pandas" (DataFrames, the
+# reference implementation) or "numpy" (plain arrays and record lists).
+FEATURE_ENGINE = os.getenv("FEATURE_ENGINE", "pandas").lower()
+
+def _process_stores(stores, engine):
+    """Returns (cleaned_stores, processed_stores, aggregated_metrics) using the selected engine."""
+    if engine == "numpy":
+        processed_stores, aggregated_metrics = process_store_records(stores)
+        return clean_store_records(stores), processed_stores, aggregated_metrics
+    if engine != "pandas":
+        raise ValueError("Feature engine must be either 'pandas' or 'numpy'")
+    if not stores:
+        processed_stores, aggregated_metrics = process_store_data(stores)
+        return clean_store_data(stores), processed_stores, aggregated_metrics
+    stores_df = pd.json_normalize(stores)
+    # Cleaning adds columns in place, so give it its own copy of the frame.
+    cleaned_stores = clean_store_frame(stores_df.copy())
+    processed_stores, aggregated_metrics = process_store_frame(stores_df)
+    return cleaned_stores, processed_stores, aggregated_metrics
+
+def build_pipeline_context(data, engine=None):
+    """
+    Run the whole feature pipeline over a fetch_data payload, computing each
+    derived artifact exactly once.
+    
+    The raw store payload is normalized with pd.json_normalize a single time and
+    the resulting frame is shared by the cleaning and feature-extraction steps;
+    the aggregated metrics and weather features are reused when building the
+    feature vector instead of being recomputed.
+    
+    engine selects the store feature engine ("pandas" or "numpy", defaults to
+    FEATURE_ENGINE). With the numpy engine the cleaned and processed stores are
+    lists of flat records rather than DataFrames; everything else is the same.
+    
+    Returns a dictionary with:
+      - cleaned_stores: cleaned store records (clean_store_data).
+      - processed_stores: processed store records (process_store_data).
+      - aggregated_metrics: store metrics from process_store_data.
+      - cleaned_weather: DataFrame from clean_weather_data.
+      - weather_features: features from process_weather_data.
+      - store_sentiment: per-category sentiment from compute_store_sentiment.
+      - feature_vector: composite feature vector, including store_sentiment.
+    """
+    stores = data.get("stores", [])
+    with metrics.stage("store_features"):
+        cleaned_stores, processed_stores, aggregated_metrics = _process_stores(stores, engine or FEATURE_ENGINE)
+    
+    weather = data.get("weather", {})
+    with metrics.stage("weather_features"):
+        cleaned_weather = clean_weather_data(weather)
+        weather_features = process_weather_data(weather)
+    
+    with metrics.stage("sentiment"):
+        store_sentiment = compute_store_sentiment(stores)
+    feature_vector = build_feature_vector(data, aggregated_metrics=aggregated_metrics,
+                                          weather_features=weather_features)
+    feature_vector["store_sentiment"] = store_sentiment
+    
+    return {
+        "cleaned_stores": cleaned_stores,
+        "processed_stores": processed_stores,
+        "aggregated_metrics": aggregated_metrics,
+        "cleaned_weather": cleaned_weather,
+        "weather_features": weather_features,
+        "store_sentiment": store_sentiment,
+        "feature_vector": feature_vector
+    }
+
+def build_feature_vector(data, aggregated_metrics=None, weather_features=None):
     """
     Build a composite feature vector from store and weather data for a recommendation engine.
     
@@ -11,22 +85,29 @@ def build_feature_vector(data):
       - Aggregated store metrics:
           - store_counts: counts per primary store type.
           - avg_ratings: average ratings per primary store type.
-          - spatial_density: number of stores within a defined radius of the centroid.
+          - spatial_density: number of stores within SPATIAL_DENSITY_RADIUS_KM of the centroid.
           - centroid: computed average latitude and longitude.
+          - competitor_density: mean number of other stores within each radius of a store.
+          - nearest_competitor: mean/median/min distance (km) from a store to its closest competitor.
       - Weather features:
           - current temperature, wind speed, temperature flag, and forecast aggregations.
       - Time features:
           - Hour of day and day of week derived from the current weather timestamp.
       - Campaign Suitability Score:
           - A composite metric based on weather (foot traffic potential) and store density.
+    
+    Pass aggregated_metrics and/or weather_features when they have already been
+    computed for this payload to skip recomputing them.
     """
     # Process store data: we only need the aggregated metrics from stores
-    stores = data.get("stores", [])
-    _, aggregated_metrics = process_store_data(stores)
+    if aggregated_metrics is None:
+        stores = data.get("stores", [])
+        _, aggregated_metrics = process_store_data(stores)
     
     # Process weather data to extract current and forecast features
     weather = data.get("weather", {})
-    weather_features = process_weather_data(weather)
+    if weather_features is None:
+        weather_features = process_weather_data(weather)
     
     # Build the initial feature vector
     feature_vector = {
@@ -35,6 +116,8 @@ def build_feature_vector(data):
         "avg_ratings": aggregated_metrics.get("avg_ratings"),
         "spatial_density": aggregated_metrics.get("spatial_density"),
         "centroid": aggregated_metrics.get("centroid"),
+        "competitor_density": aggregated_metrics.get("competitor_density"),
+        "nearest_competitor": aggregated_metrics.get("nearest_competitor"),
         "weather": weather_features,
     }
     
@@ -60,6 +143,10 @@ def build_feature_vector(data):
     else:
         feature_vector["hour_of_day"] = None
         feature_vector["day_of_week"] = None
+
+    # The store list is incomplete when Places failed part-way through a search.
+    if data.get("partial"):
+        feature_vector["partial"] = True
     
     return feature_vector
 
@@ -1,7 +1,15 @@
 import os
 import json
+import math
+import threading
+import time
+from datetime import datetime, timedelta, timezone
 import requests
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
+from src import http_client, metrics, transport
+from src.cache import TTLCache, PersistentTTLCache
+from src.catalog import PlacesCatalog
 
 # Load environment variables
 load_dotenv()
@@ -9,15 +17,117 @@ load_dotenv()
 # Replace with your actual API key
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 
+# Geocoding cache: a small in-process LRU in front of a SQLite store shared
+# by all workers, so a ZIP code is only geocoded once per TTL window.
+GEOCODE_CACHE_PATH = os.getenv("GEOCODE_CACHE_PATH", "data/geocode_cache.sqlite3")
+GEOCODE_CACHE_TTL = int(os.getenv("GEOCODE_CACHE_TTL", str(30 * 24 * 3600)))
+GEOCODE_CACHE_SIZE = int(os.getenv("GEOCODE_CACHE_SIZE", "10000"))
+
+# Worker pool for running the independent Places and Open-Meteo calls side by side.
+UPSTREAM_MAX_WORKERS = int(os.getenv("UPSTREAM_MAX_WORKERS", "16"))
+_upstream_executor = ThreadPoolExecutor(max_workers=UPSTREAM_MAX_WORKERS, thread_name_prefix="upstream")
+# Separate, bounded pool for the geocode and weather lookups shared within a batch
+# (see BatchFetcher), so batches never queue ahead of live requests.
+BATCH_UPSTREAM_WORKERS = int(os.getenv("BATCH_UPSTREAM_WORKERS", "4"))
+_batch_executor = ThreadPoolExecutor(max_workers=BATCH_UPSTREAM_WORKERS, thread_name_prefix="batch-upstream")
+
+# Places text-search cache. Entries are fresh for PLACES_CACHE_TTL seconds; after
+# that they are still served for up to PLACES_CACHE_STALE_TTL seconds while a
+# background refresh fetches a new copy. A TTL of 0 disables the cache.
+PLACES_CACHE_TTL = int(os.getenv("PLACES_CACHE_TTL", str(6 * 3600)))
+PLACES_CACHE_STALE_TTL = int(os.getenv("PLACES_CACHE_STALE_TTL", str(24 * 3600)))
+PLACES_CACHE_SIZE = int(os.getenv("PLACES_CACHE_SIZE", "2048"))
+
+# Places text-search pagination: PLACES_PAGE_SIZE results per page (at most 20)
+# and up to PLACES_MAX_PAGES pages per market, following nextPageToken. Every
+# page is a separate billed Places call and a serial round trip, so the default
+# is a single page; raise it for dense markets. While a page is being processed
+# the next one is already requested on a small pool of its own, so prefetches
+# never queue behind the upstream tasks that wait on them.
+PLACES_PAGE_SIZE = int(os.getenv("PLACES_PAGE_SIZE", "20"))
+PLACES_MAX_PAGES = int(os.getenv("PLACES_MAX_PAGES", "1"))
+PLACES_PREFETCH_WORKERS = int(os.getenv("PLACES_PREFETCH_WORKERS", "4"))
+_places_page_executor = ThreadPoolExecutor(max_workers=PLACES_PREFETCH_WORKERS, thread_name_prefix="places-page")
+
+# Local store catalog behind the Places cache: a SQLite file of places keyed by
+# place id, shared by all workers and kept across restarts. A market refreshed
+# less than CATALOG_MAX_AGE seconds ago is read from the catalog; only stale or
+# unknown markets are searched on Places again. CATALOG_ENABLED=false turns it off.
+CATALOG_ENABLED = os.getenv("CATALOG_ENABLED", "true").lower() in ("1", "true", "yes")
+CATALOG_PATH = os.getenv("CATALOG_PATH", "data/store_catalog.sqlite3")
+CATALOG_MAX_AGE = int(os.getenv("CATALOG_MAX_AGE", str(PLACES_CACHE_TTL)))
+
+# Weather cache: coordinates are snapped to a WEATHER_GRID_DEG grid so nearby ZIP
+# codes share one forecast, and entries expire shortly after the next scheduled
+# forecast model run (UTC hours in WEATHER_UPDATE_HOURS_UTC, plus a publish delay).
+WEATHER_GRID_DEG = float(os.getenv("WEATHER_GRID_DEG", "0.1"))
+WEATHER_UPDATE_HOURS_UTC = sorted(
+    int(h) for h in os.getenv("WEATHER_UPDATE_HOURS_UTC", "0,6,12,18").split(",") if h.strip()
+)
+WEATHER_UPDATE_DELAY_MIN = int(os.getenv("WEATHER_UPDATE_DELAY_MIN", "60"))
+WEATHER_CACHE_SIZE = int(os.getenv("WEATHER_CACHE_SIZE", "4096"))
+# Also request the hourly series used for daypart weather features.
+WEATHER_HOURLY = os.getenv("WEATHER_HOURLY", "false").lower() in ("1", "true", "yes")
+
+_geocode_memory_cache = TTLCache(maxsize=1024, ttl=GEOCODE_CACHE_TTL)
+_weather_cache = TTLCache(maxsize=WEATHER_CACHE_SIZE)
+_places_cache = TTLCache(maxsize=PLACES_CACHE_SIZE, ttl=PLACES_CACHE_TTL + PLACES_CACHE_STALE_TTL)
+_places_refreshing = set()
+_places_refresh_lock = threading.Lock()
+_geocode_store = None
+_catalog = None
+
+def _get_geocode_store():
+    """Open the persistent geocode cache lazily so importing this module has no disk side effects."""
+    global _geocode_store
+    if _geocode_store is None:
+        _geocode_store = PersistentTTLCache(GEOCODE_CACHE_PATH, maxsize=GEOCODE_CACHE_SIZE, ttl=GEOCODE_CACHE_TTL)
+    return _geocode_store
+
+def _get_catalog():
+    """Open the store catalog lazily so importing this module has no disk side effects."""
+    global _catalog
+    if _catalog is None:
+        _catalog = PlacesCatalog(CATALOG_PATH)
+    return _catalog
+
+def geocode_cache_stats():
+    """Returns hit/miss counters for the in-memory and persistent geocode caches."""
+    return {
+        "memory": _geocode_memory_cache.stats(),
+        "persistent": _get_geocode_store().stats()
+    }
+
+@metrics.timed("geocode")
 def get_lat_lon(zipcode):
+    """Returns latitude and longitude for a ZIP code, served from the geocode cache when possible."""
+    key = str(zipcode).strip()
+    cached = _geocode_memory_cache.get(key)
+    if cached is not None:
+        return cached
+    cached = _get_geocode_store().get(key)
+    if cached is not None:
+        location = (cached[0], cached[1])
+        _geocode_memory_cache.set(key, location)
+        return location
+
+    lat, lon = _geocode_zipcode(key)
+    # Failed lookups are not cached so a transient upstream error is retried next time.
+    if lat is not None and lon is not None:
+        _geocode_memory_cache.set(key, (lat, lon))
+        _get_geocode_store().set(key, [lat, lon])
+    return lat, lon
+
+def _geocode_zipcode(zipcode):
     """Fetches latitude and longitude for a given ZIP code using Google Geocoding API."""
-    if not GOOGLE_API_KEY:
+    # Replayed requests never reach Google, so they need no key.
+    if not GOOGLE_API_KEY and transport.UPSTREAM_MODE != "replay":
         print("Error: GOOGLE_API_KEY environment variable not set")
         return None, None
         
     url = f"https://maps.googleapis.com/maps/api/geocode/json?address={zipcode}&key={GOOGLE_API_KEY}"
     try:
-        response = requests.get(url)
+        response = http_client.get(url, bulkhead_name="google")
         response.raise_for_status()
         response_json = response.json()
         if response_json["status"] == "OK":
@@ -30,36 +140,225 @@ def get_lat_lon(zipcode):
         print(f"Error fetching geocoding data: {e}")
         return None, None
 
-def get_google_places(zipcode, store_type):
-    """Fetches nearby stores and their details from Google Places API (New Text Search)."""
-    if not GOOGLE_API_KEY:
-        return {"error": "Google API key not configured"}
-    
-    lat, lon = get_lat_lon(zipcode)
+def _places_key(zipcode, store_type):
+    return (str(zipcode).strip(), str(store_type).strip().lower())
+
+@metrics.timed("places")
+def get_google_places(zipcode, store_type, lat=None, lon=None):
+    """
+    Returns the Places text-search result for (zipcode, store_type), using the
+    Places cache with stale-while-revalidate. Pass lat/lon when the ZIP code has
+    already been geocoded for this request.
+    """
+    if PLACES_CACHE_TTL <= 0:
+        return _search_places(zipcode, store_type, lat, lon)
+
+    key = _places_key(zipcode, store_type)
+    cached = _places_cache.get(key)
+    if cached is not None:
+        places_data, fetched_at = cached
+        if time.time() - fetched_at > PLACES_CACHE_TTL:
+            _refresh_places_async(key, zipcode, store_type, lat, lon)
+        return places_data
+
+    return _fetch_and_cache_places(key, zipcode, store_type, lat, lon)
+
+def _fetch_and_cache_places(key, zipcode, store_type, lat, lon, refresh=False):
+    """
+    Fill the Places cache for key from the store catalog when its market is
+    fresh there, otherwise from Places (updating the catalog). refresh=True
+    skips the catalog read, for background refreshes of stale entries.
+    """
+    if CATALOG_ENABLED and not refresh:
+        market = _get_catalog().get_market(key[0], key[1], CATALOG_MAX_AGE)
+        if market is not None:
+            places, refreshed_at = market
+            places_data = {"places": places} if places else {}
+            _places_cache.set(key, (places_data, refreshed_at))
+            return places_data
+
+    places_data = _search_places(zipcode, store_type, lat, lon)
+    # Errors and partial results are never cached; the next request retries the upstream call.
+    if "error" not in places_data and not places_data.get("partial"):
+        _places_cache.set(key, (places_data, time.time()))
+        if CATALOG_ENABLED:
+            _get_catalog().upsert_market(key[0], key[1], places_data.get("places", []))
+    return places_data
+
+def _refresh_places_async(key, zipcode, store_type, lat, lon):
+    """Refresh a stale Places entry in the background, at most one refresh per key at a time."""
+    with _places_refresh_lock:
+        if key in _places_refreshing:
+            return
+        _places_refreshing.add(key)
+
+    def refresh():
+        try:
+            _fetch_and_cache_places(key, zipcode, store_type, lat, lon, refresh=True)
+        finally:
+            with _places_refresh_lock:
+                _places_refreshing.discard(key)
+
+    _upstream_executor.submit(refresh)
+
+def invalidate_places_cache(zipcode=None, store_type=None):
+    """
+    Drops cached Places results. With no arguments the whole cache is cleared;
+    otherwise only entries matching the given zipcode and/or store_type are removed.
+    Matching catalog markets are marked stale so they are searched again.
+    Returns the number of entries removed.
+    """
+    zip_key = str(zipcode).strip() if zipcode is not None else None
+    type_key = str(store_type).strip().lower() if store_type is not None else None
+    if CATALOG_ENABLED:
+        _get_catalog().invalidate(zip_key, type_key)
+    if zipcode is None and store_type is None:
+        removed = len(_places_cache)
+        _places_cache.clear()
+        return removed
+    removed = 0
+    for key in _places_cache.keys():
+        if (zip_key is None or key[0] == zip_key) and (type_key is None or key[1] == type_key):
+            _places_cache.delete(key)
+            removed += 1
+    return removed
+
+def places_cache_stats():
+    """Returns hit/miss counters for the Places cache and the number of refreshes in flight."""
+    stats = _places_cache.stats()
+    stats["refreshing"] = len(_places_refreshing)
+    return stats
+
+def catalog_stats():
+    """Returns hit/miss/refresh counters and the number of places and markets in the store catalog."""
+    return _get_catalog().stats() if CATALOG_ENABLED else {}
+
+def _search_places(zipcode, store_type, lat=None, lon=None):
+    """
+    Fetches nearby stores and their details from Google Places API (New Text
+    Search), following up to PLACES_MAX_PAGES result pages. If a later page
+    fails, the stores found so far are returned with "partial": True.
+    """
+    places = []
+    for page in iter_places_pages(zipcode, store_type, lat, lon):
+        if "error" in page:
+            if not places:
+                return page
+            print(f"Warning: Places pagination stopped after {len(places)} stores: {page['error']}")
+            return {"places": places, "partial": True}
+        places.extend(page.get("places", []))
+    return {"places": places} if places else {}
+
+def iter_places_pages(zipcode, store_type, lat=None, lon=None, max_pages=None):
+    """
+    Yields the Places text-search response for (zipcode, store_type) one page
+    at a time, up to max_pages (default PLACES_MAX_PAGES). The next page is
+    requested before the current one is yielded, so fetching it overlaps with
+    whatever the caller does with this one. A failure is yielded as
+    {"error": ...} and ends the iteration.
+    """
+    if not GOOGLE_API_KEY and transport.UPSTREAM_MODE != "replay":
+        yield {"error": "Google API key not configured"}
+        return
+
     if lat is None or lon is None:
-        return {"error": "Could not fetch location data."}
-    
+        lat, lon = get_lat_lon(zipcode)
+    if lat is None or lon is None:
+        yield {"error": "Could not fetch location data."}
+        return
+
+    max_pages = PLACES_MAX_PAGES if max_pages is None else max_pages
+    page = _search_places_page(zipcode, store_type)
+    pending = None
+    try:
+        for number in range(1, max_pages + 1):
+            token = page.get("nextPageToken")
+            if "error" not in page and token and number < max_pages:
+                pending = _places_page_executor.submit(_search_places_page, zipcode, store_type, token)
+            yield page
+            if pending is None:
+                return
+            page, pending = pending.result(), None
+    finally:
+        # The caller stopped early; drop a prefetch that has not started yet.
+        if pending is not None:
+            pending.cancel()
+
+def _search_places_page(zipcode, store_type, page_token=None):
+    """Fetches one page of Places text-search results."""
     url = "https://places.googleapis.com/v1/places:searchText"
     headers = {
         "Content-Type": "application/json",
         "X-Goog-Api-Key": GOOGLE_API_KEY,
-        "X-Goog-FieldMask": "places.displayName,places.formattedAddress,places.location,places.primaryType,places.types,places.rating,places.reviews"
+        "X-Goog-FieldMask": (
+            "places.id,places.displayName,places.formattedAddress,places.location,places.primaryType,"
+            "places.types,places.rating,places.reviews,nextPageToken"
+        )
     }
     data = {
-        "textQuery": f"{store_type} in {zipcode}"
+        "textQuery": f"{store_type} in {zipcode}",
+        "pageSize": PLACES_PAGE_SIZE
     }
+    if page_token:
+        data["pageToken"] = page_token
     try:
-        response = requests.post(url, headers=headers, json=data)
+        response = http_client.post(url, headers=headers, json=data, bulkhead_name="google")
         response.raise_for_status()
         return response.json()
     except requests.exceptions.RequestException as e:
         return {"error": str(e)}
 
-def get_weather_data(zipcode):
-    """Fetches 7-day daily weather forecast from Open-Meteo API based on latitude & longitude."""
-    lat, lon = get_lat_lon(zipcode)
+def snap_to_grid(lat, lon, grid=None):
+    """Snaps coordinates to the weather cache grid (WEATHER_GRID_DEG degrees by default)."""
+    grid = WEATHER_GRID_DEG if grid is None else grid
+    if grid <= 0:
+        return lat, lon
+    return (round(math.floor(lat / grid + 0.5) * grid, 6),
+            round(math.floor(lon / grid + 0.5) * grid, 6))
+
+def next_weather_update(now=None):
+    """Returns the UTC datetime at which the next forecast model run is expected to be published."""
+    now = now or datetime.now(timezone.utc)
+    delay = timedelta(minutes=WEATHER_UPDATE_DELAY_MIN)
+    midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    for day in (0, 1):
+        for hour in WEATHER_UPDATE_HOURS_UTC:
+            publish_at = midnight + timedelta(days=day, hours=hour) + delay
+            if publish_at > now:
+                return publish_at
+    return now + timedelta(hours=24)
+
+def weather_cache_stats():
+    """Returns hit/miss counters for the grid-snapped weather cache."""
+    return _weather_cache.stats()
+
+@metrics.timed("weather")
+def get_weather_data(zipcode, lat=None, lon=None):
+    """
+    Returns the 7-day daily forecast for a location, served from the weather
+    cache when a forecast for the same grid cell is still current.
+    """
+    if lat is None or lon is None:
+        lat, lon = get_lat_lon(zipcode)
     if lat is None or lon is None:
         return {"error": "Could not fetch location data."}
+
+    lat, lon = snap_to_grid(lat, lon)
+    key = (lat, lon)
+    cached = _weather_cache.get(key)
+    if cached is not None:
+        return cached
+
+    weather_data = _fetch_weather(lat, lon)
+    if "error" not in weather_data:
+        _weather_cache.set(key, weather_data, expires_at=next_weather_update().timestamp())
+    return weather_data
+
+def _fetch_weather(lat, lon):
+    """
+    Fetches 7-day daily weather forecast from Open-Meteo API based on latitude & longitude.
+    The hourly forecast is included when WEATHER_HOURLY is enabled.
+    """
     url = (
         f"https://api.open-meteo.com/v1/forecast"
         f"?latitude={lat}&longitude={lon}"
@@ -67,19 +366,18 @@ def get_weather_data(zipcode):
         f"&forecast_days=7"
         f"&timezone=auto"
     )
+    if WEATHER_HOURLY:
+        url += "&hourly=temperature_2m,relative_humidity_2m,wind_speed_10m,precipitation"
     try:
-        response = requests.get(url)
+        response = http_client.get(url)
         response.raise_for_status()
         return response.json()
     except requests.exceptions.RequestException as e:
         print(f"Error fetching weather data: {e}")
         return {"error": f"Error fetching weather data: {e}"}
 
-def fetch_data(zipcode, store_type):
-    """Fetches data for a given ZIP code and combines results."""
-    print(f"Fetching data for ZIP Code: {zipcode} and store type: {store_type}...")
-    
-    places_data = get_google_places(zipcode, store_type)
+def _combine_results(zipcode, places_data, weather_data):
+    """Combines Places and weather responses into the fetch_data payload (or the Places error)."""
     if "error" in places_data:
         return places_data
 
@@ -87,11 +385,138 @@ def fetch_data(zipcode, store_type):
     for place in places_data.get("places", []):
         stores.append(place)  # Append the place dictionary directly
 
-    weather_data = get_weather_data(zipcode)
-
     result = {
         "zipcode": zipcode,
         "stores": stores,
         "weather": weather_data
     }
+    if places_data.get("partial"):
+        result["partial"] = True
     return result
+
+def fetch_data(zipcode, store_type):
+    """Fetches data for a given ZIP code and combines results."""
+    print(f"Fetching data for ZIP Code: {zipcode} and store type: {store_type}...")
+    
+    # Geocode once and share the coordinates with both upstream calls. On failure
+    # return straight away: both calls would otherwise geocode again themselves.
+    lat, lon = get_lat_lon(zipcode)
+    if lat is None or lon is None:
+        return {"error": "Could not fetch location data."}
+
+    # Places and weather only depend on the coordinates, so fetch them concurrently.
+    weather_future = _upstream_executor.submit(get_weather_data, zipcode, lat, lon)
+    places_data = get_google_places(zipcode, store_type, lat, lon)
+    if "error" in places_data:
+        weather_future.cancel()
+        return places_data
+
+    weather_data = weather_future.result()
+    return _combine_results(zipcode, places_data, weather_data)
+
+def fetch_data_stream(zipcode, store_type):
+    """
+    Streaming counterpart of fetch_data. Returns a payload whose "store_pages"
+    is an iterator over the stores one result page at a time (see
+    iter_store_pages) and whose "weather" is a Future for the forecast, which is
+    fetched while the pages are consumed. Once the pages are exhausted,
+    "outcome" holds "partial": True if Places failed part-way through. Returns
+    the error instead when the ZIP code cannot be geocoded.
+    """
+    print(f"Streaming data for ZIP Code: {zipcode} and store type: {store_type}...")
+    lat, lon = get_lat_lon(zipcode)
+    if lat is None or lon is None:
+        return {"error": "Could not fetch location data."}
+    outcome = {}
+    return {
+        "zipcode": zipcode,
+        "store_pages": iter_store_pages(zipcode, store_type, lat, lon, outcome),
+        "weather": _upstream_executor.submit(get_weather_data, zipcode, lat, lon),
+        "outcome": outcome
+    }
+
+def iter_store_pages(zipcode, store_type, lat=None, lon=None, outcome=None):
+    """
+    Yields the stores for (zipcode, store_type) in pages of at most
+    PLACES_PAGE_SIZE stores, so callers can aggregate a market without holding
+    all of it.
+
+    Markets in the Places cache or fresh in the store catalog are replayed from
+    there. Otherwise pages are streamed from Places and written to the catalog
+    as they arrive; the market itself is only marked refreshed once every page
+    has been read. Streamed markets are not added to the in-memory Places cache,
+    which would mean buffering them; the next request reads them from the catalog.
+    If Places fails part-way through, the stream ends early and, when an outcome
+    dict is passed, outcome["partial"] is set to True.
+    """
+    key = _places_key(zipcode, store_type)
+    places = None
+    if PLACES_CACHE_TTL > 0:
+        cached = _places_cache.get(key)
+        if cached is not None:
+            places_data, fetched_at = cached
+            if time.time() - fetched_at > PLACES_CACHE_TTL:
+                _refresh_places_async(key, zipcode, store_type, lat, lon)
+            places = places_data.get("places", [])
+    if places is None and CATALOG_ENABLED:
+        market = _get_catalog().get_market(key[0], key[1], CATALOG_MAX_AGE)
+        if market is not None:
+            places, refreshed_at = market
+            if PLACES_CACHE_TTL > 0:
+                _places_cache.set(key, ({"places": places} if places else {}, refreshed_at))
+    if places is not None:
+        for start in range(0, len(places), PLACES_PAGE_SIZE):
+            yield places[start:start + PLACES_PAGE_SIZE]
+        return
+
+    place_ids = []
+    # The market is only marked refreshed if every page reached the catalog.
+    cataloged = CATALOG_ENABLED
+    for page in iter_places_pages(zipcode, store_type, lat, lon):
+        if "error" in page:
+            print(f"Warning: Places pagination stopped after {len(place_ids)} stores: {page['error']}")
+            if outcome is not None:
+                outcome["partial"] = True
+            return
+        stores = page.get("places", [])
+        if cataloged:
+            cataloged = _get_catalog().upsert_places(stores)
+        place_ids.extend(store.get("id") for store in stores)
+        yield stores
+    if cataloged:
+        _get_catalog().set_market(key[0], key[1], place_ids)
+
+class BatchFetcher:
+    """
+    Fetches data for the (zipcode, store_type) pairs of one batch while sharing
+    upstream work: each distinct ZIP code is geocoded and its forecast fetched
+    once, however many pairs use it.
+
+    Nothing is queued up front. A pair's lookups start when fetch() is called
+    for it, i.e. as the batch picks the pair up, so a large batch holds at most
+    one pair's work per batch worker. Shared lookups run on the batch upstream
+    pool, never on the pool used by live requests, and never wait on other tasks.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._locations = {}
+        self._weather = {}
+
+    def _shared(self, futures, key, fn, *args):
+        with self._lock:
+            future = futures.get(key)
+            if future is None:
+                future = futures[key] = _batch_executor.submit(fn, *args)
+        return future
+
+    def fetch(self, zipcode, store_type):
+        """Returns the same payload fetch_data would return for the pair."""
+        lat, lon = self._shared(self._locations, zipcode, get_lat_lon, zipcode).result()
+        if lat is None or lon is None:
+            return {"error": "Could not fetch location data."}
+        weather_future = self._shared(self._weather, zipcode, get_weather_data, zipcode, lat, lon)
+        places_data = get_google_places(zipcode, store_type, lat, lon)
+        if "error" in places_data:
+            return places_data
+        return _combine_results(zipcode, places_data, weather_future.result())
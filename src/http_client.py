@@ -0,0 +1,203 @@
+import contextlib
+import os
+import random
+import threading
+import time
+from collections import deque
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv
+
+from src import bulkhead, metrics, transport
+
+load_dotenv()
+
+# Shared upstream HTTP client: one pooled keep-alive session per host, bounded
+# timeouts and a retry budget that never exceeds the overall deadline.
+CONNECT_TIMEOUT = float(os.getenv("UPSTREAM_CONNECT_TIMEOUT", "3.05"))
+READ_TIMEOUT = float(os.getenv("UPSTREAM_READ_TIMEOUT", "10"))
+TOTAL_DEADLINE = float(os.getenv("UPSTREAM_DEADLINE", "15"))
+MAX_RETRIES = int(os.getenv("UPSTREAM_MAX_RETRIES", "2"))
+BACKOFF_BASE = float(os.getenv("UPSTREAM_BACKOFF_BASE", "0.2"))
+BACKOFF_MAX = float(os.getenv("UPSTREAM_BACKOFF_MAX", "2.0"))
+POOL_SIZE = int(os.getenv("UPSTREAM_POOL_SIZE", "20"))
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+LATENCY_WINDOW = 512
+
+_sessions = {}
+_stats = {}
+_lock = threading.Lock()
+
+
+def _host(url):
+    return urlsplit(url).netloc
+
+
+def _get_session(host):
+    """Return the pooled session for host, creating it on first use."""
+    with _lock:
+        session = _sessions.get(host)
+        if session is None:
+            session = requests.Session()
+            # Retries are handled in request() so they can respect the deadline.
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE, max_retries=0)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _sessions[host] = session
+        return session
+
+
+def _record(host, elapsed, status=None, error=False, retried=False, size=None):
+    metrics.UPSTREAM_REQUEST_SECONDS.observe(elapsed, host)
+    if size is not None:
+        metrics.UPSTREAM_RESPONSE_BYTES.observe(size, host)
+    with _lock:
+        stats = _stats.get(host)
+        if stats is None:
+            stats = _stats[host] = {
+                "requests": 0,
+                "errors": 0,
+                "retries": 0,
+                "status_codes": {},
+                "latencies": deque(maxlen=LATENCY_WINDOW)
+            }
+        stats["requests"] += 1
+        stats["latencies"].append(elapsed)
+        if error:
+            stats["errors"] += 1
+        if retried:
+            stats["retries"] += 1
+        if status is not None:
+            stats["status_codes"][status] = stats["status_codes"].get(status, 0) + 1
+
+
+def _backoff(attempt, response=None):
+    """Exponential backoff with full jitter, honouring Retry-After when the upstream sends one."""
+    if response is not None:
+        retry_after = response.headers.get("Retry-After")
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), BACKOFF_MAX)
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt)))
+
+
+def _slot(bulkhead_name, deadline_at):
+    """Bulkhead slot (see src/bulkhead.py) for one attempt, or a no-op when bulkhead_name is None."""
+    if bulkhead_name is None:
+        return contextlib.nullcontext()
+    return bulkhead.get(bulkhead_name).slot(deadline_at)
+
+
+def request(method, url, deadline=None, bulkhead_name=None, **kwargs):
+    """
+    Send an HTTP request through the upstream transport (see src/transport.py).
+
+    In live and record mode the request goes out through _send; in record mode
+    the final response is also saved. In replay mode the recorded response is
+    returned instead and nothing is sent. With bulkhead_name, each attempt runs
+    inside a slot of that bulkhead.
+    """
+    if transport.UPSTREAM_MODE == "replay":
+        host = _host(url)
+        deadline_at = time.monotonic() + (TOTAL_DEADLINE if deadline is None else deadline)
+        start = time.perf_counter()
+        try:
+            with _slot(bulkhead_name, deadline_at):
+                response = transport.replay_http(method, url, kwargs)
+        except requests.exceptions.ConnectionError:
+            _record(host, time.perf_counter() - start, error=True)
+            raise
+        _record(host, time.perf_counter() - start, status=response.status_code,
+                error=response.status_code >= 400, size=len(response.content))
+        return response
+
+    start = time.perf_counter()
+    response = _send(method, url, deadline, bulkhead_name, **kwargs)
+    if transport.UPSTREAM_MODE == "record":
+        transport.record_http(method, url, kwargs, response, time.perf_counter() - start)
+    return response
+
+
+def _send(method, url, deadline=None, bulkhead_name=None, **kwargs):
+    """
+    Send an HTTP request through the shared session pool.
+
+    Connection errors, timeouts and retryable status codes (429/5xx) are retried
+    up to MAX_RETRIES times with jittered backoff, as long as the total deadline
+    (seconds, defaults to UPSTREAM_DEADLINE) has not been used up. The last
+    response is returned as-is so callers keep using raise_for_status(); the last
+    exception is re-raised when no response could be obtained.
+
+    With bulkhead_name, a slot is taken for each attempt, waiting no longer
+    than the deadline, and is released before any backoff sleep. BulkheadRejected
+    is raised as-is and not retried.
+    """
+    host = _host(url)
+    session = _get_session(host)
+    deadline_at = time.monotonic() + (TOTAL_DEADLINE if deadline is None else deadline)
+    attempt = 0
+    while True:
+        remaining = deadline_at - time.monotonic()
+        if remaining <= 0:
+            raise requests.exceptions.Timeout(f"Deadline exceeded before request to {host}")
+        start = time.perf_counter()
+        try:
+            with _slot(bulkhead_name, deadline_at):
+                # Time spent waiting for the slot comes out of the deadline.
+                remaining = deadline_at - time.monotonic()
+                if remaining <= 0:
+                    raise requests.exceptions.Timeout(f"Deadline exceeded waiting to send request to {host}")
+                timeout = (min(CONNECT_TIMEOUT, remaining), min(READ_TIMEOUT, remaining))
+                start = time.perf_counter()
+                response = session.request(method, url, timeout=timeout, **kwargs)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            _record(host, time.perf_counter() - start, error=True, retried=attempt > 0)
+            delay = _backoff(attempt)
+            if attempt >= MAX_RETRIES or deadline_at - time.monotonic() <= delay:
+                raise
+            print(f"Warning: {method} {host} failed ({e}); retrying in {delay:.2f}s")
+        else:
+            _record(host, time.perf_counter() - start, status=response.status_code,
+                    error=response.status_code >= 400, retried=attempt > 0, size=len(response.content))
+            if response.status_code not in RETRY_STATUSES:
+                return response
+            delay = _backoff(attempt, response)
+            if attempt >= MAX_RETRIES or deadline_at - time.monotonic() <= delay:
+                return response
+            print(f"Warning: {method} {host} returned {response.status_code}; retrying in {delay:.2f}s")
+        time.sleep(delay)
+        attempt += 1
+
+
+def get(url, **kwargs):
+    return request("GET", url, **kwargs)
+
+
+def post(url, **kwargs):
+    return request("POST", url, **kwargs)
+
+
+def _percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def host_stats():
+    """Return per-host request counts, error/retry counts, status codes and latency percentiles (ms)."""
+    with _lock:
+        snapshot = {host: dict(stats, latencies=list(stats["latencies"]),
+                               status_codes=dict(stats["status_codes"]))
+                    for host, stats in _stats.items()}
+    result = {}
+    for host, stats in snapshot.items():
+        latencies = sorted(stats.pop("latencies"))
+        stats["p50_ms"] = _percentile(latencies, 0.50) * 1000 if latencies else None
+        stats["p95_ms"] = _percentile(latencies, 0.95) * 1000 if latencies else None
+        stats["max_ms"] = latencies[-1] * 1000 if latencies else None
+        stats["avg_ms"] = sum(latencies) / len(latencies) * 1000 if latencies else None
+        result[host] = stats
+    return result
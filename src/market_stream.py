@@ -0,0 +1,188 @@
+import math
+from array import array
+import numpy as np
+from src.cleaning import clean_weather_data
+from src.feature_pipeline import build_feature_vector
+from src.numpy_features import _empty_metrics, _flatten, _to_float
+from src.sentiment import compound_score
+from src.spatial import spatial_features
+from src.weather_features import process_weather_data
+from src import metrics
+
+# Incremental store aggregation for markets that arrive one Places result page
+# at a time (see fetch_data.fetch_data_stream).
+#
+# Each page updates running counts, rating sums and review sentiment sums per
+# primary type, and is then dropped. Only the coordinates are kept for the whole
+# market (16 bytes per store): the centroid and the density features depend on
+# every pair of stores, so they are computed once, after the last page, with the
+# grid index in src/spatial.py. Rating sums are kept exact, so results match
+# the pandas and NumPy engines.
+
+_MISSING = object()
+
+
+def _add_exact(partials, x):
+    """Add x to a list of non-overlapping partial sums (Shewchuk), so math.fsum(partials) stays exact."""
+    i = 0
+    for y in partials:
+        if abs(x) < abs(y):
+            x, y = y, x
+        hi = x + y
+        lo = y - (hi - x)
+        if lo:
+            partials[i] = lo
+            i += 1
+        x = hi
+    partials[i:] = [x]
+
+
+class MarketAggregator:
+    """
+    Running store metrics and sentiment over pages of Places stores.
+
+    Call add() with each page, then aggregated_metrics() and store_sentiment(),
+    which return the same structures as process_store_data and
+    compute_store_sentiment would for all pages together.
+    """
+
+    def __init__(self):
+        self.store_count = 0
+        self._type_counts = {}
+        self._rating_sums = {}
+        self._sentiment_sums = {}
+        self._review_counts = {}
+        self._lats = array('d')
+        self._lons = array('d')
+        self._has_primary_type = False
+        self._has_lat = False
+        self._has_lon = False
+
+    def add(self, stores):
+        """Fold one page of store dicts into the running aggregates."""
+        for store in stores:
+            record = _flatten(store)
+            self.store_count += 1
+
+            primary_type = record.get('primaryType', _MISSING)
+            self._has_primary_type = self._has_primary_type or primary_type is not _MISSING
+            rating = _to_float(record.get('rating'))
+            if math.isnan(rating):
+                rating = 3.0
+            self._type_counts[primary_type] = self._type_counts.get(primary_type, 0) + 1
+            _add_exact(self._rating_sums.setdefault(primary_type, []), rating)
+
+            self._has_lat = self._has_lat or 'location.latitude' in record
+            self._has_lon = self._has_lon or 'location.longitude' in record
+            self._lats.append(_to_float(record.get('location.latitude')))
+            self._lons.append(_to_float(record.get('location.longitude')))
+
+            # Grouped like compute_store_sentiment: a missing primaryType is "unknown".
+            group = store.get("primaryType", "unknown")
+            self._sentiment_sums.setdefault(group, 0)
+            self._review_counts.setdefault(group, 0)
+            for review in store.get("reviews", []):
+                text = review.get("text", {}).get("text", "")
+                if not text:
+                    text = review.get("originalText", {}).get("text", "")
+                if text:
+                    self._sentiment_sums[group] += compound_score(text)
+                    self._review_counts[group] += 1
+
+    def aggregated_metrics(self, centroid=None, radius_km=None, radii_km=None):
+        """Store metrics for everything added so far; same keys and parameters as process_store_data."""
+        if self.store_count == 0:
+            return _empty_metrics()
+
+        if self._has_primary_type:
+            # Stores without a primary type are skipped, as the pandas groupby does.
+            counts = {t: c for t, c in self._type_counts.items() if t is not _MISSING and t is not None}
+            rating_sums = {t: math.fsum(self._rating_sums[t]) for t in counts}
+        else:
+            counts = {'unknown': self.store_count}
+            rating_sums = {'unknown': math.fsum(p for partials in self._rating_sums.values() for p in partials)}
+
+        # value_counts order: descending count, ties in category order.
+        categories = sorted(counts)
+        store_counts = {t: counts[t] for t in sorted(categories, key=lambda t: -counts[t])}
+        avg_ratings = {t: float(rating_sums[t] / counts[t]) for t in categories}
+
+        if self._has_lat and self._has_lon:
+            lats = np.array(self._lats, dtype=float)
+            lons = np.array(self._lons, dtype=float)
+        else:
+            lats = np.zeros(self.store_count)
+            lons = np.zeros(self.store_count)
+        if centroid is None:
+            centroid = (np.nanmean(lats), np.nanmean(lons))
+        spatial = spatial_features(lats, lons, centroid, radius_km=radius_km, radii_km=radii_km)
+
+        return {
+            'store_counts': store_counts,
+            'avg_ratings': avg_ratings,
+            'spatial_density': spatial['spatial_density'],
+            'centroid': centroid,
+            'centroid_density': spatial['centroid_density'],
+            'competitor_density': spatial['competitor_density'],
+            'nearest_competitor': spatial['nearest_competitor']
+        }
+
+    def store_sentiment(self):
+        """Per-category sentiment for everything added so far, as compute_store_sentiment returns it."""
+        store_sentiment = {}
+        for primary_type, total in self._sentiment_sums.items():
+            reviews = self._review_counts[primary_type]
+            avg_sentiment = total / reviews if reviews else 0
+            if reviews and avg_sentiment >= 0.05:
+                sentiment_label = "positive"
+            elif reviews and avg_sentiment <= -0.05:
+                sentiment_label = "negative"
+            else:
+                sentiment_label = "neutral"
+            store_sentiment[primary_type] = {
+                "sentiment": sentiment_label,
+                "sentiment_score": avg_sentiment
+            }
+        return store_sentiment
+
+
+def build_streaming_context(data):
+    """
+    Counterpart of build_pipeline_context for a fetch_data_stream payload.
+
+    Store pages are aggregated as they arrive, so memory is bounded by the page
+    size rather than the market size. Returns the same keys as
+    build_pipeline_context; cleaned_stores and processed_stores are None because
+    per-store rows are not kept. If the page stream ended early, the feature
+    vector is marked "partial" as on the buffered path.
+    """
+    aggregator = MarketAggregator()
+    with metrics.stage("store_stream"):
+        for stores in data.get("store_pages", []):
+            aggregator.add(stores)
+        aggregated_metrics = aggregator.aggregated_metrics()
+        store_sentiment = aggregator.store_sentiment()
+
+    weather = data.get("weather", {})
+    if hasattr(weather, "result"):
+        weather = weather.result()
+    with metrics.stage("weather_features"):
+        cleaned_weather = clean_weather_data(weather)
+        weather_features = process_weather_data(weather)
+
+    payload = {"zipcode": data.get("zipcode"), "weather": weather}
+    if data.get("outcome", {}).get("partial"):
+        payload["partial"] = True
+    feature_vector = build_feature_vector(payload, aggregated_metrics=aggregated_metrics,
+                                          weather_features=weather_features)
+    feature_vector["store_sentiment"] = store_sentiment
+
+    return {
+        "cleaned_stores": None,
+        "processed_stores": None,
+        "aggregated_metrics": aggregated_metrics,
+        "cleaned_weather": cleaned_weather,
+        "weather_features": weather_features,
+        "store_sentiment": store_sentiment,
+        "feature_vector": feature_vector
+    }
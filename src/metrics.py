@@ -0,0 +1,233 @@
+import math
+import threading
+import time
+from bisect import bisect_left
+from functools import wraps
+
+# Minimal Prometheus metrics registry.
+#
+# Histograms and counters are recorded on the request path with a bisect and a
+# few integer increments into arrays allocated when a label set is first seen.
+# Everything else (the hit/miss/status counters the caches, HTTP client and
+# bulkheads already keep) is read from their stats functions at scrape time by
+# registered collectors, so /metrics adds no work to requests.
+
+# Seconds; covers cache hits (sub-millisecond) up to slow Gemini calls.
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+# Bytes; covers small geocoding answers up to large Places payloads.
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+# Stats fields that only ever grow; exported as counters, everything else as gauges.
+COUNTER_FIELDS = {
+    "hits", "misses", "evictions", "requests", "errors", "retries", "status_codes",
+    "admitted", "rejected", "wait_seconds", "executions", "coalesced", "calls", "prompt_tokens",
+    "response_tokens", "estimated_calls", "submitted", "sampled_out", "dropped", "written",
+    "pruned", "refreshes", "rounds", "warmed", "failed"
+}
+
+_lock = threading.Lock()
+_metrics = []
+_collectors = []
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _number(value):
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, float):
+        if math.isinf(value):
+            return "+Inf" if value > 0 else "-Inf"
+        return repr(value)
+    return str(value)
+
+
+class Counter:
+    """Monotonic counter with optional labels; inc() takes one value per label name."""
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        with self._lock:
+            values = dict(self._values)
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(values.items()):
+            lines.append(f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}")
+        return lines
+
+
+class Histogram:
+    """
+    Cumulative histogram with fixed buckets and optional labels.
+
+    observe(value, *labels) records one sample; bucket counts for a label set
+    are allocated the first time it is seen.
+    """
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                # [per-bucket counts..., +Inf count, sum]
+                series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def render(self):
+        with self._lock:
+            snapshot = {labels: list(series) for labels, series in self._series.items()}
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for labels, series in sorted(snapshot.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), series):
+                cumulative += count
+                le = ("le", "+Inf" if math.isinf(bound) else _number(bound))
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(series[-1])}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+def counter(name, documentation, labelnames=()):
+    """Create and register a Counter."""
+    metric = Counter(name, documentation, labelnames)
+    with _lock:
+        _metrics.append(metric)
+    return metric
+
+
+def histogram(name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+    """Create and register a Histogram."""
+    metric = Histogram(name, documentation, labelnames, buckets)
+    with _lock:
+        _metrics.append(metric)
+    return metric
+
+
+STAGE_SECONDS = histogram(
+    "recommendation_stage_seconds", "Time spent in each recommendation pipeline stage.", ("stage",)
+)
+UPSTREAM_REQUEST_SECONDS = histogram(
+    "upstream_request_seconds", "Duration of individual upstream HTTP attempts.", ("host",)
+)
+UPSTREAM_RESPONSE_BYTES = histogram(
+    "upstream_response_bytes", "Size of upstream HTTP response bodies.", ("host",), SIZE_BUCKETS
+)
+PROMPT_BYTES = histogram(
+    "gemini_prompt_bytes", "Size of the prompts sent to Gemini.", ("call",), SIZE_BUCKETS
+)
+GEMINI_CALLS = counter(
+    "gemini_calls_total", "Gemini calls by call name and outcome.", ("call", "outcome")
+)
+
+
+class _Stage:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        STAGE_SECONDS.observe(time.perf_counter() - self.start, self.name)
+        return False
+
+
+def stage(name):
+    """Context manager timing a pipeline stage into recommendation_stage_seconds."""
+    return _Stage(name)
+
+
+def timed(name):
+    """Decorator timing every call of a function as pipeline stage name."""
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with _Stage(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def register_stats(prefix, fn, label, sublabels=None):
+    """
+    Export a stats function at scrape time.
+
+    fn returns {label_value: {field: number}}; each numeric field becomes the
+    metric <prefix>_<field> labelled with label=<label_value>. Fields holding a
+    dict of numbers (e.g. status_codes) are exported with one extra label whose
+    name is taken from sublabels (defaulting to "key").
+    """
+    with _lock:
+        _collectors.append((prefix, fn, label, sublabels or {}))
+
+
+def _collect(prefix, fn, label, sublabels):
+    samples = {}
+    for label_value, fields in fn().items():
+        for field, value in fields.items():
+            name = f"{prefix}_{field}"
+            if isinstance(value, dict):
+                extra = sublabels.get(field, "key")
+                for key, sub_value in value.items():
+                    if isinstance(sub_value, (int, float)):
+                        samples.setdefault((name, field), []).append(
+                            (_labels((label,), (label_value,), (extra, key)), sub_value))
+            elif isinstance(value, (int, float)):
+                samples.setdefault((name, field), []).append((_labels((label,), (label_value,)), value))
+    lines = []
+    for (name, field), rows in samples.items():
+        kind = "counter" if field in COUNTER_FIELDS else "gauge"
+        if kind == "counter":
+            name += "_total"
+        lines.append(f"# TYPE {name} {kind}")
+        lines.extend(f"{name}{labels} {_number(value)}" for labels, value in rows)
+    return lines
+
+
+def render():
+    """Return every registered metric in the Prometheus text exposition format."""
+    with _lock:
+        metrics = list(_metrics)
+        collectors = list(_collectors)
+    lines = []
+    for metric in metrics:
+        lines.extend(metric.render())
+    for prefix, fn, label, sublabels in collectors:
+        try:
+            lines.extend(_collect(prefix, fn, label, sublabels))
+        except Exception as e:
+            print(f"Warning: metrics collector {prefix} failed: {e}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,205 @@
+import math
+import numpy as np
+from src.spatial import spatial_features
+
+# Lightweight store feature engine built on NumPy arrays and plain dicts.
+#
+# Mirrors clean_store_data / process_store_data for the small store lists we get
+# from one Places search, without the fixed per-call cost of pandas and sklearn.
+# Processed stores are returned as a list of flat records (the same columns the
+# pandas path produces, in the same order) instead of a DataFrame.
+
+
+def _empty_metrics():
+    return {
+        'store_counts': {},
+        'avg_ratings': {},
+        'spatial_density': 0,
+        'centroid': (0, 0),
+        'centroid_density': {},
+        'competitor_density': {},
+        'nearest_competitor': {}
+    }
+
+
+def _flatten_nested(record, prefix, flat):
+    for key, value in record.items():
+        if isinstance(value, dict):
+            _flatten_nested(value, f"{prefix}{key}.", flat)
+        else:
+            flat[f"{prefix}{key}"] = value
+    return flat
+
+
+def _flatten(record):
+    """
+    Flatten nested dicts into dotted keys, like pd.json_normalize does for a single record:
+    top-level scalar fields come first, then the nested fields in order; empty dicts are dropped.
+    """
+    flat = {key: value for key, value in record.items() if not isinstance(value, dict)}
+    nested = {key: value for key, value in record.items() if isinstance(value, dict)}
+    return _flatten_nested(nested, '', flat)
+
+
+def normalize_records(stores):
+    """
+    Flatten a list of store dicts into records sharing the same columns.
+
+    Returns (records, columns); columns keep the order in which keys first
+    appear, and keys missing from a record are filled with None.
+    """
+    flat = [_flatten(store) for store in stores]
+    columns = {}
+    for record in flat:
+        for key in record:
+            columns.setdefault(key, None)
+    columns = list(columns)
+    records = [{column: record.get(column) for column in columns} for record in flat]
+    return records, columns
+
+
+def _to_float(value, default=math.nan):
+    if value is None or isinstance(value, bool):
+        return default
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def _ratings(records, columns):
+    """Return the rating column as a float array with missing or invalid values set to 3.0."""
+    if 'rating' not in columns:
+        print("Warning: No 'rating' column found. Creating default ratings of 3.0.")
+        return np.full(len(records), 3.0)
+    ratings = np.array([_to_float(record['rating']) for record in records], dtype=float)
+    missing = np.isnan(ratings)
+    if missing.any():
+        print("Missing ratings found. Filling with default value of 3.0.")
+        ratings[missing] = 3.0
+    return ratings
+
+
+def _minmax(values):
+    """Min-max scale an array, returning zeros when there is no variation."""
+    if values.size == 0:
+        return values
+    low, high = values.min(), values.max()
+    if high == low:
+        return np.zeros(values.size)
+    return (values - low) / (high - low)
+
+
+def clean_store_records(stores):
+    """
+    NumPy counterpart of clean_store_data.
+
+    Returns a list of flat store records with imputed 'rating',
+    'rating_normalized' and float coordinates.
+    """
+    if not stores:
+        print("Warning: No stores found. Returning empty records.")
+        return []
+
+    records, columns = normalize_records(stores)
+    ratings = _ratings(records, columns)
+    rating_normalized = _minmax(ratings)
+    has_lat = 'location.latitude' in columns
+    has_lon = 'location.longitude' in columns
+
+    for i, record in enumerate(records):
+        record['rating'] = float(ratings[i])
+        if has_lat:
+            record['location.latitude'] = _to_float(record['location.latitude'], None)
+        if has_lon:
+            record['location.longitude'] = _to_float(record['location.longitude'], None)
+        record['rating_normalized'] = float(rating_normalized[i])
+    return records
+
+
+def process_store_records(stores, centroid=None, radius_km=None, radii_km=None):
+    """
+    NumPy counterpart of process_store_data.
+
+    Takes the same parameters and returns (records, aggregated_metrics), where
+    records carry the same columns as the pandas DataFrame: one-hot encoded
+    store types, imputed and normalized ratings, coordinates and the
+    spatial columns from src/spatial.py (distance_from_centroid,
+    nearest_competitor_km, competitors_within_<radius>).
+    """
+    if not stores:
+        print("Warning: No stores found. Returning empty records and default metrics.")
+        return [], _empty_metrics()
+
+    records, columns = normalize_records(stores)
+    count = len(records)
+
+    # One-hot encode "types" with the classes sorted, as MultiLabelBinarizer does.
+    if 'types' not in columns:
+        print("Warning: No 'types' column found. Creating empty types list.")
+        for record in records:
+            record['types'] = []
+    type_sets = [set(record['types'] or []) for record in records]
+    classes = sorted(set().union(*type_sets))
+
+    if 'primaryType' not in columns:
+        print("Warning: No 'primaryType' column found. Creating default primaryType.")
+        primary_types = ['unknown'] * count
+    else:
+        primary_types = [record['primaryType'] for record in records]
+
+    ratings = _ratings(records, columns)
+    rating_normalized = _minmax(ratings)
+
+    if 'location.latitude' not in columns or 'location.longitude' not in columns:
+        print("Warning: Missing location columns. Using default coordinates.")
+        lats = np.zeros(count)
+        lons = np.zeros(count)
+    else:
+        lats = np.array([_to_float(record['location.latitude']) for record in records], dtype=float)
+        lons = np.array([_to_float(record['location.longitude']) for record in records], dtype=float)
+
+    if centroid is None:
+        centroid = (np.nanmean(lats), np.nanmean(lons))
+
+    spatial = spatial_features(lats, lons, centroid, radius_km=radius_km, radii_km=radii_km)
+    distances = spatial['distance_from_centroid']
+    nearest_km = spatial['nearest_competitor_km']
+
+    for i, record in enumerate(records):
+        for cls in classes:
+            record[cls] = 1 if cls in type_sets[i] else 0
+        record['primaryType'] = primary_types[i]
+        record['rating'] = float(ratings[i])
+        record['rating_normalized'] = float(rating_normalized[i])
+        record['location.latitude'] = None if math.isnan(lats[i]) else float(lats[i])
+        record['location.longitude'] = None if math.isnan(lons[i]) else float(lons[i])
+        record['distance_from_centroid'] = None if math.isnan(distances[i]) else float(distances[i])
+        record['nearest_competitor_km'] = None if math.isnan(nearest_km[i]) else float(nearest_km[i])
+        for label, counts in spatial['competitors_within'].items():
+            record[f'competitors_within_{label}'] = int(counts[i])
+
+    # Aggregated Store Metrics, grouped by primary type (missing types are skipped like pandas does).
+    categories = sorted({t for t in primary_types if t is not None})
+    index = {t: i for i, t in enumerate(categories)}
+    codes = np.array([index.get(t, -1) for t in primary_types], dtype=int)
+    valid = codes >= 0
+    counts = np.bincount(codes[valid], minlength=len(categories))
+    # math.fsum gives correctly rounded group sums, matching pandas' compensated groupby mean.
+    rating_sums = [math.fsum(ratings[codes == i]) for i in range(len(categories))]
+
+    # value_counts order: descending count, ties in category order.
+    order = sorted(range(len(categories)), key=lambda i: -counts[i])
+    store_counts = {categories[i]: int(counts[i]) for i in order}
+    avg_ratings = {t: float(rating_sums[i] / counts[i]) for i, t in enumerate(categories)}
+
+    aggregated_metrics = {
+        'store_counts': store_counts,
+        'avg_ratings': avg_ratings,
+        'spatial_density': spatial['spatial_density'],
+        'centroid': centroid,
+        'centroid_density': spatial['centroid_density'],
+        'competitor_density': spatial['competitor_density'],
+        'nearest_competitor': spatial['nearest_competitor']
+    }
+    return records, aggregated_metrics
@@ -0,0 +1,300 @@
+# Pre-warming of hot markets ahead of peak traffic.
+#
+# In the server (PREWARM_MODE=worker) a background thread runs a round at each
+# of PREWARM_TIMES_UTC. A round warms the hot (zipcode, store_type) pairs: those
+# listed in PREWARM_KEYS_FILE, then the PREWARM_TOP_N pairs requested most often
+# in the last PREWARM_TRAFFIC_WINDOW seconds. Warming a pair runs the same
+# pipeline a request would, so the geocode, Places, catalog, weather and
+# sentiment caches are filled, and with PREWARM_TARGET=recommendations the
+# recommendation cache too. PREWARM_TARGET=upstream fills only the caches in
+# front of the paid upstream APIs; feature vectors are not precomputed, since
+# they depend on the time of the request.
+#
+# From the command line the same rounds can be sent to a running server over HTTP:
+#     python -m src.prewarm --url http://localhost:3000 [--keys-file hot.csv]
+#         [--from-server 200] [--rate 30] [--concurrency 2] [--mode refined]
+import os
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from src import bulkhead
+
+# PREWARM_MODE: "off" (default) or "worker" to run scheduled rounds in the server.
+# PREWARM_TIMES_UTC: comma-separated HH:MM (UTC) at which rounds start, e.g.
+#   shortly before the morning peak. Checked when the worker starts; an invalid
+#   entry keeps the worker from being scheduled.
+# PREWARM_KEYS_FILE: optional file of "zipcode,store_type" lines (# starts a comment).
+# PREWARM_TOP_N / PREWARM_TRAFFIC_WINDOW: how many of the most requested pairs,
+#   over how many seconds of recent traffic, are added to the file's pairs.
+# PREWARM_TARGET: "recommendations" (full pipeline including the Gemini calls)
+#   or "upstream" (Google, weather and review sentiment caches only; no Gemini
+#   quota used). "features", its former name, is still accepted.
+# PREWARM_MODES: recommendation modes to warm, comma-separated.
+# PREWARM_RATE / PREWARM_CONCURRENCY: pairs started per minute and pairs in
+#   flight at once, to stay within Places and Gemini quotas. Rounds also pause
+#   while live requests are queued on the upstream bulkheads.
+PREWARM_MODE = os.getenv("PREWARM_MODE", "off").lower()
+PREWARM_TIMES_UTC = [t.strip() for t in os.getenv("PREWARM_TIMES_UTC", "10:30").split(",") if t.strip()]
+PREWARM_KEYS_FILE = os.getenv("PREWARM_KEYS_FILE")
+PREWARM_TOP_N = int(os.getenv("PREWARM_TOP_N", "300"))
+PREWARM_TRAFFIC_WINDOW = int(os.getenv("PREWARM_TRAFFIC_WINDOW", str(7 * 24 * 3600)))
+PREWARM_TRAFFIC_MAX_EVENTS = int(os.getenv("PREWARM_TRAFFIC_MAX_EVENTS", "200000"))
+PREWARM_TARGET = os.getenv("PREWARM_TARGET", "recommendations").lower().replace("features", "upstream")
+PREWARM_MODES = [m.strip().lower() for m in os.getenv("PREWARM_MODES", "refined").split(",") if m.strip()]
+PREWARM_RATE = float(os.getenv("PREWARM_RATE", "30"))
+PREWARM_CONCURRENCY = int(os.getenv("PREWARM_CONCURRENCY", "2"))
+# Seconds to wait between checks while live requests are queued.
+PREWARM_BACKOFF = float(os.getenv("PREWARM_BACKOFF", "5"))
+
+
+def normalize_key(zipcode, store_type):
+    """Returns the (zipcode, store_type) key used for traffic counts and keys files."""
+    return (str(zipcode).strip(), str(store_type).strip().lower())
+
+
+class TrafficTracker:
+    """Recent (zipcode, store_type) requests, bounded to max_events, for deriving hot keys."""
+
+    def __init__(self, max_events=PREWARM_TRAFFIC_MAX_EVENTS):
+        self._events = deque(maxlen=max_events)
+        self._lock = threading.Lock()
+
+    def record(self, zipcode, store_type):
+        with self._lock:
+            self._events.append((time.time(), normalize_key(zipcode, store_type)))
+
+    def top(self, n, window=PREWARM_TRAFFIC_WINDOW):
+        """Return up to n (key, count) pairs requested in the last window seconds, most requested first."""
+        since = time.time() - window
+        counts = {}
+        with self._lock:
+            events = list(self._events)
+        for timestamp, key in events:
+            if timestamp >= since:
+                counts[key] = counts.get(key, 0) + 1
+        return sorted(counts.items(), key=lambda item: -item[1])[:n]
+
+
+class RateLimiter:
+    """Token bucket allowing rate_per_minute acquisitions per minute, with bursts of up to burst."""
+
+    def __init__(self, rate_per_minute, burst=1):
+        self.interval = 60.0 / rate_per_minute if rate_per_minute > 0 else 0.0
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a token is available."""
+        if not self.interval:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) / self.interval)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) * self.interval
+            time.sleep(wait)
+
+
+def read_keys_file(path):
+    """Read "zipcode,store_type" lines; blank lines and # comments are skipped."""
+    keys = []
+    with open(path) as f:
+        for number, line in enumerate(f, 1):
+            line = line.split("#", 1)[0].strip()
+            if not line:
+                continue
+            parts = [part.strip() for part in line.split(",")]
+            if len(parts) != 2 or not all(parts):
+                print(f"Warning: skipping malformed prewarm key on line {number} of {path}: {line!r}")
+                continue
+            keys.append(normalize_key(*parts))
+    return keys
+
+
+def hot_keys(tracker=None, keys_file=None, top_n=None):
+    """Keys from keys_file (in file order), then the most requested keys in recent traffic, without duplicates."""
+    keys_file = PREWARM_KEYS_FILE if keys_file is None else keys_file
+    top_n = PREWARM_TOP_N if top_n is None else top_n
+    keys = []
+    if keys_file:
+        try:
+            keys.extend(read_keys_file(keys_file))
+        except OSError as e:
+            print(f"Warning: could not read prewarm keys from {keys_file}: {e}")
+    if tracker is not None and top_n > 0:
+        keys.extend(key for key, _ in tracker.top(top_n))
+    return list(dict.fromkeys(keys))
+
+
+def parse_times(entries):
+    """Parse HH:MM entries into (hour, minute) pairs. Raises ValueError naming the first invalid entry."""
+    times = []
+    for entry in entries:
+        hour, sep, minute = entry.partition(":")
+        if not (sep and hour.strip().isdigit() and minute.strip().isdigit()):
+            raise ValueError(f"invalid prewarm time {entry!r}; expected HH:MM")
+        hour, minute = int(hour), int(minute)
+        if hour > 23 or minute > 59:
+            raise ValueError(f"invalid prewarm time {entry!r}; hours must be 0-23 and minutes 0-59")
+        times.append((hour, minute))
+    return times
+
+
+def next_run(times, now=None):
+    """Returns the next UTC datetime matching one of the (hour, minute) pairs in times, or None if there are none."""
+    now = now or datetime.now(timezone.utc)
+    midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    candidates = []
+    for hour, minute in times:
+        at = midnight + timedelta(hours=hour, minutes=minute)
+        candidates.append(at if at > now else at + timedelta(days=1))
+    return min(candidates) if candidates else None
+
+
+def upstreams_busy():
+    """True while live requests are queued on any upstream bulkhead."""
+    return any(stats["queue_depth"] > 0 for stats in bulkhead.bulkhead_stats().values())
+
+
+class PrewarmWorker:
+    """
+    Runs prewarm rounds: warm(zipcode, store_type) for every hot key, started
+    at most rate_per_minute per minute with up to concurrency in flight.
+
+    Counters (rounds, warmed, failed, last round duration) are available through stats().
+    """
+
+    def __init__(self, warm, tracker=None, rate_per_minute=None, concurrency=None, busy=upstreams_busy):
+        self.warm = warm
+        self.tracker = tracker
+        self.limiter = RateLimiter(PREWARM_RATE if rate_per_minute is None else rate_per_minute)
+        self.concurrency = max(1, PREWARM_CONCURRENCY if concurrency is None else concurrency)
+        self.busy = busy
+        self._lock = threading.Lock()
+        self._running = threading.Lock()
+        self._stats = {"rounds": 0, "warmed": 0, "failed": 0, "last_round_keys": 0, "last_round_seconds": 0.0}
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._stats[name] += amount
+
+    def _warm_one(self, key):
+        self.limiter.acquire()
+        # Live traffic goes first: wait while requests are queued on the upstreams.
+        while self.busy is not None and self.busy():
+            time.sleep(PREWARM_BACKOFF)
+        try:
+            self.warm(*key)
+            self._count("warmed")
+        except Exception as e:
+            self._count("failed")
+            print(f"Warning: prewarm failed for {key[0]}/{key[1]}: {e}")
+
+    def run_round(self, keys=None):
+        """Warm keys (default: hot_keys()) and return how many were attempted. Rounds never overlap."""
+        if not self._running.acquire(blocking=False):
+            return 0
+        try:
+            keys = hot_keys(self.tracker) if keys is None else keys
+            start = time.monotonic()
+            with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="prewarm") as executor:
+                list(executor.map(self._warm_one, keys))
+            with self._lock:
+                self._stats["rounds"] += 1
+                self._stats["last_round_keys"] = len(keys)
+                self._stats["last_round_seconds"] = time.monotonic() - start
+            return len(keys)
+        finally:
+            self._running.release()
+
+    def run_forever(self, times_utc=None):
+        """Run a round at each scheduled time (HH:MM entries, validated once up front), forever."""
+        times_utc = PREWARM_TIMES_UTC if times_utc is None else times_utc
+        try:
+            times = parse_times(times_utc)
+        except ValueError as e:
+            print(f"Error: PREWARM_TIMES_UTC is invalid: {e}. The prewarm worker is not scheduled.")
+            return
+        if not times:
+            print("Warning: PREWARM_TIMES_UTC is empty; the prewarm worker is not scheduled.")
+            return
+        while True:
+            at = next_run(times)
+            time.sleep(max(0.0, (at - datetime.now(timezone.utc)).total_seconds()))
+            try:
+                self.run_round()
+            except Exception as e:
+                print(f"Warning: prewarm round failed: {e}")
+
+    def start(self):
+        """Start run_forever in a daemon thread."""
+        thread = threading.Thread(target=self.run_forever, name="prewarm", daemon=True)
+        thread.start()
+        return thread
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats["running"] = int(self._running.locked())
+        return stats
+
+
+def _warm_over_http(session, url, mode, timeout):
+    def warm(zipcode, store_type):
+        # prewarm=1 keeps these calls out of the server's traffic counts.
+        response = session.get(f"{url}/recommend", params={"zipcode": zipcode, "store_type": store_type,
+                                                           "mode": mode, "prewarm": "1"}, timeout=timeout)
+        if response.status_code != 200:
+            raise RuntimeError(f"/recommend returned {response.status_code}")
+    return warm
+
+
+def main():
+    import argparse
+    import requests
+
+    parser = argparse.ArgumentParser(description="Warm the recommendation caches of a running server for hot markets.")
+    parser.add_argument("--url", default="http://localhost:3000")
+    parser.add_argument("--keys-file", default=PREWARM_KEYS_FILE, help="File of zipcode,store_type lines.")
+    parser.add_argument("--from-server", type=int, default=0, metavar="N",
+                        help="Also warm the server's N most requested pairs (GET /prewarm/keys).")
+    parser.add_argument("--rate", type=float, default=PREWARM_RATE, help="Pairs started per minute.")
+    parser.add_argument("--concurrency", type=int, default=PREWARM_CONCURRENCY)
+    parser.add_argument("--mode", choices=("refined", "fast"), default="refined")
+    parser.add_argument("--timeout", type=float, default=120)
+    args = parser.parse_args()
+
+    url = args.url.rstrip("/")
+    session = requests.Session()
+    keys = read_keys_file(args.keys_file) if args.keys_file else []
+    if args.from_server:
+        response = session.get(f"{url}/prewarm/keys", params={"limit": args.from_server}, timeout=args.timeout)
+        response.raise_for_status()
+        keys.extend(normalize_key(item["zipcode"], item["store_type"]) for item in response.json()["keys"])
+    keys = list(dict.fromkeys(keys))
+    if not keys:
+        parser.error("No keys to warm; pass --keys-file and/or --from-server.")
+
+    # The server's own bulkheads shed load if needed; the CLI only paces itself.
+    worker = PrewarmWorker(_warm_over_http(session, url, args.mode, args.timeout),
+                           rate_per_minute=args.rate, concurrency=args.concurrency, busy=None)
+    start = time.monotonic()
+    worker.run_round(keys)
+    stats = worker.stats()
+    print(f"Warmed {stats['warmed']} of {len(keys)} pairs in {time.monotonic() - start:.1f} s "
+          f"({stats['failed']} failed)")
+    return 1 if stats["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,308 @@
+import json
+import math
+import os
+import threading
+
+from src import metrics
+
+# Prompt builders for the Gemini calls.
+#
+# Market data is embedded as compact JSON: no indentation or spaces after
+# separators, None/NaN fields dropped, floats rounded to PROMPT_FLOAT_DECIMALS
+# and fields that repeat another one (avg_temp is the same as avg_max_temp)
+# left out. When a prompt is still over PROMPT_TOKEN_BUDGET the data is
+# trimmed step by step (see _REDUCERS); the instructions and the initial
+# campaign handed to the expert pass are never trimmed.
+#   PROMPT_TOKEN_BUDGET: maximum estimated prompt tokens (0 disables trimming).
+#   PROMPT_CHARS_PER_TOKEN: characters per token used for the estimate.
+#   PROMPT_FLOAT_DECIMALS: decimals kept for floats.
+#   PROMPT_TOP_CATEGORIES: store categories kept once trimming reaches them.
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "3000"))
+PROMPT_CHARS_PER_TOKEN = float(os.getenv("PROMPT_CHARS_PER_TOKEN", "4"))
+PROMPT_FLOAT_DECIMALS = int(os.getenv("PROMPT_FLOAT_DECIMALS", "2"))
+PROMPT_TOP_CATEGORIES = int(os.getenv("PROMPT_TOP_CATEGORIES", "10"))
+
+# Weather fields that duplicate another field of the same dict.
+REDUNDANT_WEATHER_FIELDS = ("avg_temp",)
+
+_usage_lock = threading.Lock()
+_usage = {}
+
+
+def estimate_tokens(text):
+    """Rough token count for text (characters / PROMPT_CHARS_PER_TOKEN)."""
+    return int(math.ceil(len(text) / PROMPT_CHARS_PER_TOKEN))
+
+
+def compact(value):
+    """Recursively drop None/NaN values and empty containers, and round floats."""
+    if isinstance(value, dict):
+        items = ((str(k), compact(v)) for k, v in value.items())
+        return {k: v for k, v in items if v is not None and v != {} and v != []}
+    if isinstance(value, (list, tuple)):
+        items = (compact(v) for v in value)
+        return [v for v in items if v is not None]
+    if isinstance(value, float):
+        if math.isnan(value) or math.isinf(value):
+            return None
+        return round(value, PROMPT_FLOAT_DECIMALS)
+    return value
+
+
+def to_prompt_json(value):
+    """Serialize an already compacted value for a prompt, without whitespace."""
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False, default=str)
+
+
+def _drop_redundant(weather):
+    if isinstance(weather, dict):
+        for field in REDUNDANT_WEATHER_FIELDS:
+            weather.pop(field, None)
+    return weather
+
+
+def _weather_sections(payload):
+    """Weather dicts in this payload (weather_features, or the feature vector's weather)."""
+    sections = [payload.get("weather_features")]
+    if isinstance(payload.get("feature_vector"), dict):
+        sections.append(payload["feature_vector"].get("weather"))
+    return [s for s in sections if isinstance(s, dict)]
+
+
+def _metric_sections(payload):
+    """Dicts holding store_counts / avg_ratings / centroid in this payload."""
+    return [payload[key] for key in ("feature_vector", "aggregated_metrics") if isinstance(payload.get(key), dict)]
+
+
+def _sentiment_sections(payload):
+    sections = [payload.get("store_sentiment")]
+    if isinstance(payload.get("feature_vector"), dict):
+        sections.append(payload["feature_vector"].get("store_sentiment"))
+    return [s for s in sections if isinstance(s, dict)]
+
+
+def _drop_weather_field(field):
+    def reduce(payload):
+        for weather in _weather_sections(payload):
+            weather.pop(field, None)
+    return reduce
+
+
+def _drop_centroid(payload):
+    for metrics in _metric_sections(payload):
+        metrics.pop("centroid", None)
+
+
+def _top_categories(limit):
+    def reduce(payload):
+        # Keep the categories with the most stores; store_counts is already ordered by count.
+        for metrics in _metric_sections(payload):
+            counts = metrics.get("store_counts") or {}
+            if len(counts) <= limit:
+                continue
+            keep = set(list(counts)[:limit])
+            metrics["store_counts"] = {k: v for k, v in counts.items() if k in keep}
+            if isinstance(metrics.get("avg_ratings"), dict):
+                metrics["avg_ratings"] = {k: v for k, v in metrics["avg_ratings"].items() if k in keep}
+            for sentiment in _sentiment_sections(payload):
+                for category in [c for c in sentiment if c not in keep]:
+                    del sentiment[category]
+    return reduce
+
+
+# Applied in order until the prompt fits the budget.
+_REDUCERS = (
+    _drop_weather_field("daypart_forecast"),
+    _drop_centroid,
+    _top_categories(PROMPT_TOP_CATEGORIES),
+    _drop_weather_field("weekly_forecast"),
+    _top_categories(max(1, PROMPT_TOP_CATEGORIES // 2)),
+)
+
+
+def _fit(render, payload, name):
+    """
+    Render a prompt from payload, trimming the payload with _REDUCERS until the
+    estimated token count fits PROMPT_TOKEN_BUDGET. Returns (prompt, tokens).
+    """
+    prompt = render(payload)
+    tokens = estimate_tokens(prompt)
+    if PROMPT_TOKEN_BUDGET <= 0:
+        return prompt, tokens
+    for reducer in _REDUCERS:
+        if tokens <= PROMPT_TOKEN_BUDGET:
+            break
+        reducer(payload)
+        prompt = render(payload)
+        tokens = estimate_tokens(prompt)
+    if tokens > PROMPT_TOKEN_BUDGET:
+        print(f"Warning: {name} prompt is ~{tokens} tokens, over the budget of {PROMPT_TOKEN_BUDGET}.")
+    return prompt, tokens
+
+
+def build_marketing_prompt(context, feature_vector):
+    """Build the campaign generator prompt. Returns (prompt, estimated_tokens)."""
+    feature_vector = compact(feature_vector)
+    _drop_redundant(feature_vector.get("weather"))
+
+    def render(payload):
+        return f"""
+You are a strategic marketing consultant with deep insights into local market dynamics. Your task is to generate a concise, poster-ready marketing campaign recommendation for a local store based on the provided JSON data and current real-time context. The recommendation should be visually appealing, succinct, and output in valid JSON format only (without any additional text).
+
+CURRENT REAL-TIME CONTEXT:
+- Current Date: {context['current_date']}
+- Current Time: {context['current_time']}
+- Current Day: {context['current_day']}
+- Time Context: {context['time_context']}
+- Day Context: {context['day_context']}
+- Tomorrow: {context['tomorrow']}
+- This Weekend: {context['this_weekend_start']} - {context['this_weekend_end']}
+- Next Week Start: {context['next_week_start']}
+
+IMPORTANT: Use these current dates for your campaign durations. Do NOT use past dates or hardcoded dates like "November 2024". Use the current date context provided above.
+
+The JSON data you will use includes:
+- "store_counts": Number of nearby competitor stores by category (e.g., clothing_store, book_store, grocery_store, etc.).
+- "avg_ratings": Average customer ratings for each store category.
+- "spatial_density": Indicator of how clustered competitor stores are.
+- "centroid": Geographic center coordinates for the market.
+- "weather": 7-day daily forecast (max/min temp, precipitation, weather code) and summary stats (avg_max_temp, avg_min_temp, total_precip).
+- "hour_of_day" and "day_of_week": The current temporal context for time-sensitive promotions.
+- "store_sentiment": Customer sentiment analysis and scores for each store category.
+- "campaign_suitability_score": A metric indicating overall campaign readiness.
+
+Output your recommendation using the following JSON structure exactly and give output in json format without any additional text:
+
+{{
+  "Insights": [
+    "Insight 1: Based on the 7-day weather forecast and time context",
+    "Insight 2: Based on local competition analysis",
+    "Insight 3: Based on spatial density and market saturation",
+    "Insight 4: Based on customer ratings and sentiment analysis",
+    "Insight 5: Based on consumer behavior patterns for the week"
+  ],
+  "Campaigns": [
+    {{
+      "Campaign Title": "Create a compelling, time-relevant campaign title for a specific day or period in the next 7 days",
+      "Campaign Description": "Write a 2-3 sentence description that leverages the 7-day weather forecast, time, and market conditions",
+      "Campaign Duration": "Use dates from the next 7 days (e.g., 'June 22, 2024 - June 28, 2024')",
+      "Discount/Promo": "Create a relevant promotional offer based on the 7-day forecast and market context"
+    }},
+    {{
+      "Campaign Title": "Create a second compelling campaign title for another day or period in the next 7 days",
+      "Campaign Description": "Write a 2-3 sentence description targeting another aspect of the 7-day forecast and market conditions",
+      "Campaign Duration": "Use dates from the next 7 days",
+      "Discount/Promo": "Create another relevant promotional offer"
+    }}
+  ]
+}}
+
+CRITICAL REQUIREMENTS:
+1. Use ONLY dates from the next 7 days for campaign durations
+2. Make campaigns relevant to the weather and market context for specific days in the upcoming week
+3. Consider the 7-day weather forecast in your recommendations
+4. Base insights on the actual data provided
+5. Ensure all dates are current and realistic
+6. Keep campaign descriptions to 2-3 sentences maximum
+
+Generate at least two campaign recommendations in JSON Format as above with distinct insights based on the provided JSON data and 7-day context.
+
+JSON Data:
+{to_prompt_json(payload["feature_vector"])}
+"""
+
+    return _fit(render, {"feature_vector": feature_vector}, "marketing")
+
+
+def build_expert_prompt(context, zipcode, store_type, aggregated_metrics, weather_features,
+                        store_sentiment, initial_campaign):
+    """Build the marketing-expert refinement prompt. Returns (prompt, estimated_tokens)."""
+    payload = {
+        "aggregated_metrics": compact(aggregated_metrics),
+        "weather_features": _drop_redundant(compact(weather_features)),
+        "store_sentiment": compact(store_sentiment),
+        "initial_campaign": initial_campaign
+    }
+
+    def render(payload):
+        return f"""
+You are a senior marketing expert with 15+ years of experience in retail marketing, consumer psychology, and campaign optimization. Your role is to analyze and improve marketing campaign recommendations to make them more realistic, compelling, and effective.
+
+CURRENT CONTEXT:
+- Current Date: {context['current_date']}
+- Store Type: {store_type}
+- Location: {zipcode}
+
+RAW CLEANED DATA FOR ANALYSIS:
+Store Data: {to_prompt_json(payload["aggregated_metrics"])}
+Weather Data: {to_prompt_json(payload["weather_features"])}
+Store Sentiment: {to_prompt_json(payload["store_sentiment"])}
+
+ANALYZE THE FOLLOWING INITIAL CAMPAIGN RECOMMENDATIONS:
+{to_prompt_json(payload["initial_campaign"])}
+
+MARKETING EXPERT TASK:
+1. **Realism Check**: Ensure campaigns are realistic for the store type and market conditions
+2. **Consumer Psychology**: Make recommendations more psychologically compelling
+3. **Competitive Edge**: Ensure campaigns stand out from typical local promotions
+4. **Actionability**: Make campaigns more actionable and measurable
+5. **Seasonal Relevance**: Ensure weather and seasonal factors are properly leveraged
+6. **Local Market Fit**: Adapt to local consumer behavior patterns
+
+IMPROVEMENT GUIDELINES:
+- Make campaign titles more catchy and memorable
+- Ensure promotional offers are realistic and profitable
+- Add specific timing strategies based on weather patterns
+- Include psychological triggers (urgency, scarcity, social proof)
+- Make descriptions more compelling and benefit-focused (2-3 sentences maximum)
+- Ensure insights are actionable and data-driven based on the provided raw data
+- Use actual data from the raw cleaned data to create specific, actionable insights
+
+OUTPUT FORMAT:
+Return the improved campaign recommendations in the same JSON structure, but with enhanced content that addresses the above criteria. Focus on making the campaigns more realistic, compelling, and effective for real-world implementation.
+
+CRITICAL: Use the actual data provided above to create specific insights. Do not mention "data needed" - use the real data available.
+
+Return only valid JSON without any additional text.
+"""
+
+    return _fit(render, payload, "expert")
+
+
+def _usage_count(usage, field):
+    value = getattr(usage, field, None) if usage is not None else None
+    return value if isinstance(value, int) else None
+
+
+def record_usage(call, prompt, response):
+    """
+    Record prompt and response token counts for one Gemini call.
+
+    Counts come from response.usage_metadata when the SDK reports them and are
+    estimated from the text otherwise. Returns the counts for this call.
+    """
+    metrics.PROMPT_BYTES.observe(len(prompt.encode("utf-8")), call)
+    usage = getattr(response, "usage_metadata", None)
+    prompt_tokens = _usage_count(usage, "prompt_token_count")
+    response_tokens = _usage_count(usage, "candidates_token_count")
+    estimated = prompt_tokens is None or response_tokens is None
+    if prompt_tokens is None:
+        prompt_tokens = estimate_tokens(prompt)
+    if response_tokens is None:
+        try:
+            response_tokens = estimate_tokens(response.text or "")
+        except (AttributeError, ValueError):
+            response_tokens = 0
+    with _usage_lock:
+        totals = _usage.setdefault(call, {"calls": 0, "prompt_tokens": 0, "response_tokens": 0, "estimated_calls": 0})
+        totals["calls"] += 1
+        totals["prompt_tokens"] += prompt_tokens
+        totals["response_tokens"] += response_tokens
+        totals["estimated_calls"] += int(estimated)
+    return {"call": call, "prompt_tokens": prompt_tokens, "response_tokens": response_tokens, "estimated": estimated}
+
+
+def token_stats():
+    """Returns per-call totals of prompt and response tokens."""
+    with _usage_lock:
+        return {call: dict(totals) for call, totals in _usage.items()}
@@ -0,0 +1,93 @@
+import hashlib
+import json
+import math
+import os
+from datetime import date
+
+from src.cache import TTLCache
+
+# Cache of final Gemini recommendations keyed on a fingerprint of the feature
+# vector. Values that only jitter between requests are quantized first, so
+# requests for the same market on the same day map to the same key:
+#   - temperatures are bucketed to REC_CACHE_TEMP_BUCKET degrees,
+#   - ratings and sentiment scores are rounded to REC_CACHE_RATING_DECIMALS,
+#   - precipitation is rounded to whole millimetres,
+#   - the date is taken at day granularity.
+REC_CACHE_TTL = int(os.getenv("REC_CACHE_TTL", str(6 * 3600)))
+REC_CACHE_SIZE = int(os.getenv("REC_CACHE_SIZE", "1024"))
+REC_CACHE_TEMP_BUCKET = float(os.getenv("REC_CACHE_TEMP_BUCKET", "2.0"))
+REC_CACHE_RATING_DECIMALS = int(os.getenv("REC_CACHE_RATING_DECIMALS", "1"))
+
+_cache = TTLCache(maxsize=REC_CACHE_SIZE, ttl=REC_CACHE_TTL)
+
+
+def _rule(name):
+    """Returns the quantization rule for a field name, or None if the name carries no rule."""
+    name = str(name).lower()
+    if "temp" in name:
+        return "temperature"
+    if "rating" in name or "sentiment" in name or "suitability" in name:
+        return "rating"
+    if "precip" in name:
+        return "precipitation"
+    return None
+
+
+def _quantize(rule, value):
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return value
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    if rule == "temperature":
+        return math.floor(value / REC_CACHE_TEMP_BUCKET) * REC_CACHE_TEMP_BUCKET
+    if rule == "rating":
+        return round(value, REC_CACHE_RATING_DECIMALS)
+    if rule == "precipitation":
+        return round(value)
+    if isinstance(value, float):
+        return round(value, 3)
+    return value
+
+
+def _canonical(value, rule=None):
+    # Keys without a rule of their own (e.g. store categories inside avg_ratings)
+    # inherit the rule of the enclosing field.
+    if isinstance(value, dict):
+        return {str(k): _canonical(v, _rule(k) or rule) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_canonical(v, rule) for v in value]
+    return _quantize(rule, value)
+
+
+def fingerprint(feature_vector, store_type, day=None, mode="refined"):
+    """
+    Returns a stable hash for a feature vector, store type, day and recommendation mode.
+
+    Two requests whose feature vectors only differ below the quantization
+    thresholds produce the same fingerprint.
+    """
+    canonical = {
+        "store_type": str(store_type).strip().lower(),
+        "day": (day or date.today()).isoformat(),
+        "mode": mode,
+        "features": _canonical(feature_vector)
+    }
+    encoded = json.dumps(canonical, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+def get(key):
+    return _cache.get(key)
+
+
+def put(key, recommendation):
+    _cache.set(key, recommendation)
+
+
+def invalidate():
+    _cache.clear()
+
+
+def recommendation_cache_stats():
+    """Returns hit/miss counters for the recommendation cache."""
+    return _cache.stats()
@@ -1,10 +1,65 @@
-import nltk
-from nltk.sentiment.vader import SentimentIntensityAnalyzer
+import hashlib
+import os
+import threading
+from src.cache import TTLCache
 
-# Ensure required NLTK data is downloaded
-nltk.download('vader_lexicon')
-nltk.download('stopwords')
-nltk.download('punkt')
+# Compound scores are memoized by a hash of the review text; Places returns the
+# same reviews for the same stores day after day.
+SENTIMENT_CACHE_SIZE = int(os.getenv("SENTIMENT_CACHE_SIZE", "50000"))
+# Only fetch a missing VADER lexicon over the network when explicitly allowed;
+# by default it must already be installed in the local NLTK data path.
+NLTK_DOWNLOAD_MISSING = os.getenv("NLTK_DOWNLOAD_MISSING", "false").lower() in ("1", "true", "yes")
+
+_analyzer = None
+_analyzer_lock = threading.Lock()
+_score_cache = TTLCache(maxsize=SENTIMENT_CACHE_SIZE)
+
+def check_resources():
+    """Returns True if the VADER lexicon is available in the local NLTK data path (no network access)."""
+    import nltk
+    try:
+        nltk.data.find('sentiment/vader_lexicon.zip')
+        return True
+    except LookupError:
+        return False
+
+def get_analyzer():
+    """
+    Returns the process-wide VADER analyzer, loading nltk and the lexicon on first use.
+    
+    Nothing is imported or downloaded at import time. A missing lexicon raises
+    LookupError unless NLTK_DOWNLOAD_MISSING is set, in which case it is
+    downloaded once here.
+    """
+    global _analyzer
+    if _analyzer is None:
+        with _analyzer_lock:
+            if _analyzer is None:
+                import nltk
+                from nltk.sentiment.vader import SentimentIntensityAnalyzer
+                if not check_resources():
+                    if not NLTK_DOWNLOAD_MISSING:
+                        raise LookupError(
+                            "VADER lexicon not found in the local NLTK data path. Install it with "
+                            "`python -m nltk.downloader vader_lexicon` or set NLTK_DOWNLOAD_MISSING=true."
+                        )
+                    print("Warning: VADER lexicon not found locally. Downloading it.")
+                    nltk.download('vader_lexicon', quiet=True)
+                _analyzer = SentimentIntensityAnalyzer()
+    return _analyzer
+
+def compound_score(text):
+    """Returns the VADER compound score for a review text, memoized by a hash of the text."""
+    key = hashlib.blake2b(text.encode('utf-8'), digest_size=16).digest()
+    score = _score_cache.get(key)
+    if score is None:
+        score = get_analyzer().polarity_scores(text)['compound']
+        _score_cache.set(key, score)
+    return score
+
+def sentiment_cache_stats():
+    """Returns hit/miss counters and hit rate for the review score cache."""
+    return _score_cache.stats()
 
 def compute_store_sentiment(stores):
     """
@@ -19,8 +74,6 @@ def compute_store_sentiment(stores):
          ...
       }
     """
-    sia = SentimentIntensityAnalyzer()
-    
     # Group stores by primaryType.
     store_groups = {}
     for store in stores:
@@ -46,7 +99,7 @@ def compute_store_sentiment(stores):
         
         if review_texts:
             # Compute compound sentiment scores for each review.
-            scores = [sia.polarity_scores(text)['compound'] for text in review_texts]
+            scores = [compound_score(text) for text in review_texts]
             avg_sentiment = sum(scores) / len(scores)
             # Determine sentiment label based on the average compound score.
             if avg_sentiment >= 0.05:
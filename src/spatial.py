@@ -0,0 +1,207 @@
+import math
+import os
+import numpy as np
+
+# Spatial features over store coordinates, shared by the pandas and NumPy
+# store engines. Distances are great-circle (haversine) kilometres.
+#
+# Neighbour queries use a uniform grid over latitude/longitude whose cells are
+# at least as wide as the largest query radius, so every store within that
+# radius of a point lies in the point's cell or one of the 8 around it. Each
+# pair of neighbouring cells is compared as one vectorized block (split into
+# row chunks so no distance matrix grows beyond MAX_BLOCK_ELEMENTS).
+#   SPATIAL_DENSITY_RADIUS_KM: radius around the centroid used for spatial_density.
+#   SPATIAL_DENSITY_RADII_KM: radii for the multi-radius density features.
+SPATIAL_DENSITY_RADIUS_KM = float(os.getenv("SPATIAL_DENSITY_RADIUS_KM", "1.0"))
+SPATIAL_DENSITY_RADII_KM = tuple(
+    float(r) for r in os.getenv("SPATIAL_DENSITY_RADII_KM", "0.5,1,2").split(",") if r.strip()
+)
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+MAX_BLOCK_ELEMENTS = 1 << 20
+
+# Each unordered pair of neighbouring cells is visited once: the cell itself
+# plus the four "forward" neighbours.
+_FORWARD_OFFSETS = ((0, 1), (1, -1), (1, 0), (1, 1))
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance in km; arguments broadcast like NumPy arrays."""
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(v, dtype=float)) for v in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def radius_label(radius_km):
+    """Key used for a radius in feature names, e.g. 0.5 -> '0.5km'."""
+    return f"{radius_km:g}km"
+
+
+class GridIndex:
+    """
+    Grid index over store coordinates for bulk radius and nearest-neighbour queries.
+
+    Parameters:
+    - lats, lons: store coordinates in degrees; stores with a NaN coordinate are not indexed.
+    - cell_km: minimum cell width in km; queries are exact up to this radius.
+    """
+
+    def __init__(self, lats, lons, cell_km):
+        self.lats = np.asarray(lats, dtype=float)
+        self.lons = np.asarray(lons, dtype=float)
+        self.cell_km = cell_km
+        valid = np.flatnonzero(~(np.isnan(self.lats) | np.isnan(self.lons)))
+        self.cells = {}
+        if valid.size == 0:
+            return
+
+        lat_step = cell_km / KM_PER_DEGREE
+        # Longitude degrees shrink towards the poles; size cells for the highest latitude present.
+        reference = min(89.0, float(np.max(np.abs(self.lats[valid]))))
+        lon_step = lat_step / math.cos(math.radians(reference))
+        rows = np.floor(self.lats[valid] / lat_step).astype(np.int64)
+        cols = np.floor(self.lons[valid] / lon_step).astype(np.int64)
+
+        keys, inverse = np.unique(np.stack([rows, cols], axis=1), axis=0, return_inverse=True)
+        inverse = inverse.ravel()
+        order = np.argsort(inverse, kind="stable")
+        bounds = np.searchsorted(inverse[order], np.arange(len(keys) + 1))
+        for k, (row, col) in enumerate(keys):
+            self.cells[(int(row), int(col))] = valid[order[bounds[k]:bounds[k + 1]]]
+
+    def _distances(self, a, b):
+        return haversine_km(self.lats[a][:, None], self.lons[a][:, None], self.lats[b][None, :], self.lons[b][None, :])
+
+    def blocks(self):
+        """
+        Yield (rows, cols, distances, symmetric) for every pair of neighbouring cells.
+
+        For a cell compared with itself (symmetric=True) the block covers both
+        directions of every pair and the diagonal is inf; otherwise each pair
+        appears once and belongs to both rows and cols.
+        """
+        for (row, col), members in self.cells.items():
+            chunk = max(1, MAX_BLOCK_ELEMENTS // len(members))
+            for start in range(0, len(members), chunk):
+                rows = members[start:start + chunk]
+                distances = self._distances(rows, members)
+                distances[np.arange(len(rows)), np.arange(start, start + len(rows))] = np.inf
+                yield rows, members, distances, True
+            for d_row, d_col in _FORWARD_OFFSETS:
+                other = self.cells.get((row + d_row, col + d_col))
+                if other is None:
+                    continue
+                chunk = max(1, MAX_BLOCK_ELEMENTS // len(other))
+                for start in range(0, len(members), chunk):
+                    rows = members[start:start + chunk]
+                    yield rows, other, self._distances(rows, other), False
+
+
+def neighbor_stats(lats, lons, radii_km):
+    """
+    For every store, count the other stores within each radius and find the nearest one.
+
+    Returns (counts, nearest_km, nearest_index): counts has one column per
+    radius in radii_km; stores without coordinates (or without any other
+    store) get NaN distances and index -1.
+    """
+    lats = np.asarray(lats, dtype=float)
+    lons = np.asarray(lons, dtype=float)
+    n = lats.size
+    radii = np.asarray(radii_km, dtype=float)
+    counts = np.zeros((n, radii.size), dtype=np.int64)
+    nearest_km = np.full(n, np.inf)
+    nearest_index = np.full(n, -1, dtype=np.int64)
+    if n == 0:
+        return counts, nearest_km, nearest_index
+
+    cell_km = float(radii.max()) if radii.size else 1.0
+    index = GridIndex(lats, lons, cell_km)
+
+    def update_nearest(points, distances, candidates, axis):
+        best = np.argmin(distances, axis=axis)
+        best_km = np.take_along_axis(distances, np.expand_dims(best, axis), axis).squeeze(axis)
+        closer = best_km < nearest_km[points]
+        nearest_km[points[closer]] = best_km[closer]
+        nearest_index[points[closer]] = candidates[best[closer]]
+
+    for rows, cols, distances, symmetric in index.blocks():
+        within = distances[..., None] <= radii
+        counts[rows] += within.sum(axis=1)
+        update_nearest(rows, distances, cols, axis=1)
+        if not symmetric:
+            counts[cols] += within.sum(axis=0)
+            update_nearest(cols, distances, rows, axis=0)
+
+    # Grid results are exact up to cell_km; check the remaining stores against every store.
+    valid = np.flatnonzero(~(np.isnan(lats) | np.isnan(lons)))
+    for point in valid[nearest_km[valid] > cell_km]:
+        distances = haversine_km(lats[point], lons[point], lats[valid], lons[valid])
+        distances[valid == point] = np.inf
+        if distances.size and np.isfinite(distances.min()):
+            best = int(np.argmin(distances))
+            nearest_km[point] = distances[best]
+            nearest_index[point] = valid[best]
+
+    nearest_km[~np.isfinite(nearest_km)] = np.nan
+    return counts, nearest_km, nearest_index
+
+
+def _summary(values):
+    values = values[~np.isnan(values)]
+    if values.size == 0:
+        return {"mean_km": None, "median_km": None, "min_km": None}
+    return {
+        "mean_km": float(values.mean()),
+        "median_km": float(np.median(values)),
+        "min_km": float(values.min())
+    }
+
+
+def spatial_features(lats, lons, centroid, radius_km=None, radii_km=None):
+    """
+    Compute per-store and market-level spatial features.
+
+    Parameters:
+    - lats, lons: store coordinates in degrees (NaN where unknown).
+    - centroid: (latitude, longitude) the centroid distances are measured from.
+    - radius_km: radius around the centroid for spatial_density (default SPATIAL_DENSITY_RADIUS_KM).
+    - radii_km: radii for the density features (default SPATIAL_DENSITY_RADII_KM).
+
+    Returns a dict with per-store arrays
+      - distance_from_centroid: haversine km to the centroid,
+      - nearest_competitor_km: km to the closest other store,
+      - competitors_within: {radius label: number of other stores within that radius},
+    and market-level metrics
+      - spatial_density: stores within radius_km of the centroid,
+      - centroid_density: {radius label: stores within that radius of the centroid},
+      - competitor_density: {radius label: mean number of other stores within that radius of a store},
+      - nearest_competitor: mean/median/min nearest-competitor distance in km.
+    """
+    radius_km = SPATIAL_DENSITY_RADIUS_KM if radius_km is None else radius_km
+    radii_km = tuple(SPATIAL_DENSITY_RADII_KM if radii_km is None else radii_km)
+    lats = np.asarray(lats, dtype=float)
+    lons = np.asarray(lons, dtype=float)
+
+    distances = haversine_km(lats, lons, centroid[0], centroid[1])
+    counts, nearest_km, _ = neighbor_stats(lats, lons, radii_km)
+    located = ~np.isnan(distances)
+
+    # NaN distances compare False, so stores without coordinates are not counted.
+    with np.errstate(invalid='ignore'):
+        spatial_density = int(np.count_nonzero(distances <= radius_km))
+        centroid_density = {radius_label(r): int(np.count_nonzero(distances <= r)) for r in radii_km}
+    competitor_density = {
+        radius_label(r): float(counts[located, k].mean()) if located.any() else 0.0
+        for k, r in enumerate(radii_km)
+    }
+    return {
+        "distance_from_centroid": distances,
+        "nearest_competitor_km": nearest_km,
+        "competitors_within": {radius_label(r): counts[:, k] for k, r in enumerate(radii_km)},
+        "spatial_density": spatial_density,
+        "centroid_density": centroid_density,
+        "competitor_density": competitor_density,
+        "nearest_competitor": _summary(nearest_km)
+    }
@@ -0,0 +1,232 @@
+import hashlib
+import json
+import math
+import os
+import random
+import threading
+import time
+import types
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import requests
+from requests.structures import CaseInsensitiveDict
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Upstream transport mode, shared by the HTTP client (Places, Geocoding,
+# Open-Meteo) and the Gemini calls:
+#   UPSTREAM_MODE: "live" (default), "record" (live, and every exchange is
+#     saved under RECORDINGS_DIR) or "replay" (answers come from RECORDINGS_DIR
+#     and nothing leaves the process).
+#   REPLAY_LATENCY: latency injected per replayed call; per dependency with
+#     REPLAY_LATENCY_<PLACES|GEOCODE|WEATHER|GEMINI>. One of:
+#       "recorded"                 the latency measured when recording (default),
+#       "none",
+#       "fixed:<ms>",
+#       "uniform:<low_ms>,<high_ms>",
+#       "lognormal:<median_ms>,<sigma>"   long-tailed, like real upstreams.
+#   REPLAY_LATENCY_SCALE: multiplier applied to every injected latency.
+# A replayed request without an exact recording gets the nearest one: the
+# recording of the same dependency and endpoint (e.g. another ZIP code)
+# chosen deterministically from the request, so load tests can use inputs
+# that were never recorded.
+UPSTREAM_MODE = os.getenv("UPSTREAM_MODE", "live").lower()
+RECORDINGS_DIR = os.getenv("RECORDINGS_DIR", "data/recordings")
+REPLAY_LATENCY = os.getenv("REPLAY_LATENCY", "recorded")
+REPLAY_LATENCY_SCALE = float(os.getenv("REPLAY_LATENCY_SCALE", "1.0"))
+
+# Query parameters and headers that carry credentials; never written to disk
+# or used in recording keys.
+SECRET_PARAMS = {"key", "api_key"}
+SECRET_HEADERS = {"x-goog-api-key", "authorization"}
+
+DEPENDENCIES = {
+    "places.googleapis.com": "places",
+    "maps.googleapis.com": "geocode",
+    "api.open-meteo.com": "weather"
+}
+
+_index_lock = threading.Lock()
+_index = {}
+_stats_lock = threading.Lock()
+_stats = {"recorded": 0, "replayed": 0, "nearest": 0, "missing": 0}
+
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def dependency(host):
+    """Returns the dependency name for an upstream host (the host itself when unknown)."""
+    return DEPENDENCIES.get(host, host)
+
+
+def _redact_url(url):
+    parts = urlsplit(url)
+    query = [(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if k.lower() not in SECRET_PARAMS]
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, urlencode(query), ""))
+
+
+def _key(*parts):
+    encoded = json.dumps(parts, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+def _directory(name, route):
+    return os.path.join(RECORDINGS_DIR, name, hashlib.sha256(route.encode("utf-8")).hexdigest()[:16])
+
+
+def _write(directory, key, recording):
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{key}.json")
+    tmp_path = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(recording, f, separators=(",", ":"))
+    os.replace(tmp_path, path)
+    with _index_lock:
+        _index.pop(directory, None)
+    _count("recorded")
+
+
+def _load(directory, key):
+    """Return (recording, exact) for key, falling back to the nearest recording in directory."""
+    path = os.path.join(directory, f"{key}.json")
+    exact = os.path.exists(path)
+    if not exact:
+        with _index_lock:
+            names = _index.get(directory)
+            if names is None:
+                names = _index[directory] = sorted(
+                    name for name in os.listdir(directory) if name.endswith(".json")
+                ) if os.path.isdir(directory) else []
+        if not names:
+            _count("missing")
+            return None, False
+        path = os.path.join(directory, names[int(key, 16) % len(names)])
+        _count("nearest")
+    with open(path) as f:
+        recording = json.load(f)
+    _count("replayed")
+    return recording, exact
+
+
+def _parse_latency(spec):
+    kind, _, args = spec.partition(":")
+    values = [float(v) for v in args.split(",") if v.strip()]
+    return kind.strip().lower(), values
+
+
+def sample_latency(name, recorded=None):
+    """Seconds of latency to inject for one replayed call to dependency name."""
+    kind, values = _parse_latency(os.getenv(f"REPLAY_LATENCY_{name.upper()}", REPLAY_LATENCY))
+    if kind == "recorded":
+        ms = (recorded or 0) * 1000
+    elif kind == "fixed":
+        ms = values[0]
+    elif kind == "uniform":
+        ms = random.uniform(values[0], values[1])
+    elif kind == "lognormal":
+        ms = random.lognormvariate(math.log(values[0]), values[1])
+    else:
+        ms = 0
+    return max(0.0, ms * REPLAY_LATENCY_SCALE / 1000)
+
+
+def _http_route(method, url):
+    parts = urlsplit(url)
+    return parts.netloc, f"{method} {parts.netloc}{parts.path}"
+
+
+def _http_key(method, url, kwargs):
+    headers = {k.lower(): v for k, v in (kwargs.get("headers") or {}).items() if k.lower() not in SECRET_HEADERS}
+    return _key(method, _redact_url(url), headers, kwargs.get("json"), kwargs.get("data"))
+
+
+def record_http(method, url, kwargs, response, elapsed):
+    """Save one live HTTP exchange (credentials removed)."""
+    host, route = _http_route(method, url)
+    try:
+        _write(_directory(dependency(host), route), _http_key(method, url, kwargs), {
+            "request": {"method": method, "url": _redact_url(url), "json": kwargs.get("json")},
+            "response": {
+                "status": response.status_code,
+                "headers": {"Content-Type": response.headers.get("Content-Type", "application/json")},
+                "body": response.text
+            },
+            "elapsed": elapsed
+        })
+    except OSError as e:
+        print(f"Warning: failed to record {route}: {e}")
+
+
+def replay_http(method, url, kwargs):
+    """
+    Return a requests.Response rebuilt from the recording for this request,
+    after sleeping the injected latency. Raises requests.ConnectionError when
+    nothing was recorded for the endpoint.
+    """
+    host, route = _http_route(method, url)
+    name = dependency(host)
+    recording, _ = _load(_directory(name, route), _http_key(method, url, kwargs))
+    if recording is None:
+        raise requests.exceptions.ConnectionError(f"No recording for {route} in {RECORDINGS_DIR}")
+    time.sleep(sample_latency(name, recording.get("elapsed")))
+
+    response = requests.Response()
+    response.status_code = recording["response"]["status"]
+    response.headers = CaseInsensitiveDict(recording["response"].get("headers") or {})
+    response._content = recording["response"]["body"].encode("utf-8")
+    response.encoding = "utf-8"
+    response.url = url
+    response.reason = "Replayed"
+    return response
+
+
+def generate_content(model, call, prompt, generation_config):
+    """
+    Run model.generate_content(prompt, generation_config=...) through the
+    upstream transport. In replay mode the model is not called; the returned
+    object exposes .text and .usage_metadata like a Gemini response.
+    """
+    directory = _directory("gemini", call)
+    # The generation config is fixed per call name, so the prompt identifies the request.
+    key = _key(call, prompt)
+
+    if UPSTREAM_MODE == "replay":
+        recording, _ = _load(directory, key)
+        if recording is None:
+            raise RuntimeError(f"No Gemini recording for call '{call}' in {RECORDINGS_DIR}")
+        time.sleep(sample_latency("gemini", recording.get("elapsed")))
+        usage = recording.get("usage") or {}
+        return types.SimpleNamespace(
+            text=recording["text"],
+            usage_metadata=types.SimpleNamespace(**usage) if usage else None
+        )
+
+    start = time.perf_counter()
+    response = model.generate_content(prompt, generation_config=generation_config)
+    if UPSTREAM_MODE == "record":
+        usage = getattr(response, "usage_metadata", None)
+        try:
+            _write(directory, key, {
+                "call": call,
+                "text": response.text,
+                "usage": {
+                    "prompt_token_count": getattr(usage, "prompt_token_count", None),
+                    "candidates_token_count": getattr(usage, "candidates_token_count", None)
+                } if usage is not None else None,
+                "elapsed": time.perf_counter() - start
+            })
+        except (OSError, ValueError) as e:
+            print(f"Warning: failed to record Gemini call '{call}': {e}")
+    return response
+
+
+def transport_stats():
+    """Returns the transport mode and recorded/replayed/nearest/missing counters."""
+    with _stats_lock:
+        stats = dict(_stats)
+    stats["mode"] = UPSTREAM_MODE
+    return stats
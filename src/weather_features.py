@@ -1,3 +1,131 @@
+import numpy as np
+
+# Hour ranges (local time, end exclusive) used to split hourly forecasts into
+# dayparts; they match the morning/afternoon/evening split in server.py.
+DAYPARTS = {
+    "morning": (6, 12),
+    "afternoon": (12, 17),
+    "evening": (17, 22),
+    "night": (22, 6)
+}
+
+def _to_array(values):
+    """Convert an Open-Meteo value list to a float array, with missing values as NaN."""
+    if not values:
+        return np.empty(0)
+    return np.array(values, dtype=float)
+
+def _to_value(value):
+    """Convert a NumPy scalar to a JSON-friendly float, mapping NaN to None."""
+    value = float(value)
+    return None if np.isnan(value) else value
+
+def _nan_stat(func, values):
+    """Apply a NaN-aware reduction, returning None when there is no valid value."""
+    if values.size == 0 or np.isnan(values).all():
+        return None
+    return _to_value(func(values))
+
+def _daypart_codes(hours):
+    """Map an array of hours (0-23) to indexes into DAYPARTS."""
+    codes = np.empty(hours.size, dtype=int)
+    for code, (start, end) in enumerate(DAYPARTS.values()):
+        if start < end:
+            mask = (hours >= start) & (hours < end)
+        else:
+            mask = (hours >= start) | (hours < end)
+        codes[mask] = code
+    return codes
+
+def _group_mean(codes, values, groups):
+    valid = ~np.isnan(values)
+    counts = np.bincount(codes[valid], minlength=groups)
+    sums = np.bincount(codes[valid], weights=values[valid], minlength=groups)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(counts > 0, sums / np.maximum(counts, 1), np.nan)
+
+def _group_sum(codes, values, groups):
+    valid = ~np.isnan(values)
+    counts = np.bincount(codes[valid], minlength=groups)
+    sums = np.bincount(codes[valid], weights=values[valid], minlength=groups)
+    return np.where(counts > 0, sums, np.nan)
+
+def _group_extreme(codes, values, groups, func, fill):
+    result = np.full(groups, fill)
+    valid = ~np.isnan(values)
+    func.at(result, codes[valid], values[valid])
+    return np.where(result == fill, np.nan, result)
+
+def process_hourly_weather(hourly):
+    """
+    Aggregate an Open-Meteo hourly forecast into daypart windows.
+    
+    Returns (dayparts, daypart_forecast, avg_humidity, max_wind):
+      - dayparts: per daypart over the whole forecast, avg/min/max temperature
+        and total precipitation.
+      - daypart_forecast: one entry per date with avg temperature and total
+        precipitation for each daypart. Night hours are attributed to the
+        date they fall on.
+      - avg_humidity / max_wind: from relative_humidity_2m and wind_speed_10m.
+    Returns (None, None, None, None) when there is no usable hourly data.
+    """
+    times = hourly.get('time') or []
+    if not times:
+        return None, None, None, None
+    
+    stamps = np.array(times, dtype='datetime64[h]')
+    days = stamps.astype('datetime64[D]')
+    hours = (stamps - days).astype(int)
+    n = stamps.size
+    
+    def column(key):
+        values = _to_array(hourly.get(key))
+        if values.size != n:
+            return np.full(n, np.nan)
+        return values
+    
+    temps = column('temperature_2m')
+    precip = column('precipitation')
+    humidity = column('relative_humidity_2m')
+    wind = column('wind_speed_10m')
+    
+    names = list(DAYPARTS)
+    parts = len(names)
+    part_codes = _daypart_codes(hours)
+    
+    # Weekly window per daypart.
+    part_mean = _group_mean(part_codes, temps, parts)
+    part_min = _group_extreme(part_codes, temps, parts, np.minimum, np.inf)
+    part_max = _group_extreme(part_codes, temps, parts, np.maximum, -np.inf)
+    part_precip = _group_sum(part_codes, precip, parts)
+    dayparts = {
+        name: {
+            "avg_temp": _to_value(part_mean[i]),
+            "min_temp": _to_value(part_min[i]),
+            "max_temp": _to_value(part_max[i]),
+            "total_precip": _to_value(part_precip[i])
+        }
+        for i, name in enumerate(names)
+    }
+    
+    # Per-date window per daypart, computed with one grouped pass over (date, daypart).
+    unique_days, day_codes = np.unique(days, return_inverse=True)
+    cell_codes = day_codes * parts + part_codes
+    cells = unique_days.size * parts
+    cell_mean = _group_mean(cell_codes, temps, cells).reshape(unique_days.size, parts)
+    cell_precip = _group_sum(cell_codes, precip, cells).reshape(unique_days.size, parts)
+    daypart_forecast = []
+    for d, day in enumerate(unique_days):
+        entry = {"date": str(day)}
+        for i, name in enumerate(names):
+            entry[name] = {
+                "avg_temp": _to_value(cell_mean[d, i]),
+                "precipitation": _to_value(cell_precip[d, i])
+            }
+        daypart_forecast.append(entry)
+    
+    return dayparts, daypart_forecast, _nan_stat(np.nanmean, humidity), _nan_stat(np.nanmax, wind)
+
 def process_weather_data(weather):
     """
     Process weather data to extract features from daily forecast data.
@@ -24,6 +152,12 @@ def process_weather_data(weather):
               - temperature_2m_min: list of minimum temperatures,
               - precipitation_sum: list of precipitation amounts,
               - weathercode: list of weather codes.
+      - Hourly windows (only when weather['hourly'] is present):
+          - dayparts / daypart_forecast: see process_hourly_weather.
+          - avg_humidity and max_wind are then taken from the hourly series.
+    
+    Each series is converted to a NumPy array once and aggregated in bulk;
+    missing values are treated as NaN.
     """
     current = weather.get('current', {})
     daily = weather.get('daily', {})
@@ -37,13 +171,13 @@ def process_weather_data(weather):
     temp_flag = "cold" if current_temp is not None and current_temp < temp_threshold else "warm"
     
     # Daily Forecast Aggregation (7-day forecast)
-    max_temps = daily.get('temperature_2m_max', [])
-    min_temps = daily.get('temperature_2m_min', [])
-    precipitation = daily.get('precipitation_sum', [])
-    weathercodes = daily.get('weathercode', [])
+    max_temps = _to_array(daily.get('temperature_2m_max'))
+    min_temps = _to_array(daily.get('temperature_2m_min'))
+    precipitation = _to_array(daily.get('precipitation_sum'))
+    weathercodes = daily.get('weathercode') or []
     
     # Handle missing weather data gracefully
-    if not max_temps:
+    if max_temps.size == 0:
         print("Warning: No daily temperature data available. Using default values.")
         # Return default weather features
         return {
@@ -64,49 +198,60 @@ def process_weather_data(weather):
         }
     
     # Calculate weekly statistics from daily data
-    avg_temp = sum(max_temps) / len(max_temps) if max_temps else None
-    max_temp = max(max_temps) if max_temps else None
-    min_temp = min(min_temps) if min_temps else None
+    avg_temp = _nan_stat(np.nanmean, max_temps)
+    max_temp = _nan_stat(np.nanmax, max_temps)
+    min_temp = _nan_stat(np.nanmin, min_temps)
     temp_variability = max_temp - min_temp if max_temp is not None and min_temp is not None else None
     
-    # Note: Humidity and wind speed might not be available in daily data
-    # We'll set these to None for now
+    # Humidity and wind speed are not part of the daily data; they are filled
+    # from the hourly series when it was requested.
     avg_humidity = None
     max_wind = None
+    dayparts = daypart_forecast = None
+    if weather.get('hourly'):
+        dayparts, daypart_forecast, avg_humidity, max_wind = process_hourly_weather(weather['hourly'])
     
     # Define adverse weather conditions:
     # Example: adverse if min temperature is below 0°C or high precipitation
     adverse_weather = False
     if min_temp is not None and min_temp < 0:
         adverse_weather = True
-    if precipitation and any(p > 10 for p in precipitation):  # More than 10mm precipitation
-        adverse_weather = True
+    with np.errstate(invalid='ignore'):
+        if precipitation.size and (precipitation > 10).any():  # More than 10mm precipitation
+            adverse_weather = True
     
-    # 7-day Daily Forecast
-    weekly_forecast = []
-    if daily:
-        times = daily.get('time', [])
-        for i in range(len(times)):
-            forecast = {
-                "date": times[i],
-                "max_temp": max_temps[i] if i < len(max_temps) else None,
-                "min_temp": min_temps[i] if i < len(min_temps) else None,
-                "precipitation": precipitation[i] if i < len(precipitation) else None,
-                "weathercode": weathercodes[i] if i < len(weathercodes) else None
-            }
-            weekly_forecast.append(forecast)
-    else:
-        weekly_forecast = None
+    # 7-day Daily Forecast, padded with NaN where a series is shorter than 'time'
+    times = daily.get('time') or []
+    days = len(times)
+    
+    def padded(values):
+        result = np.full(days, np.nan)
+        result[:min(days, values.size)] = values[:days]
+        return result
+    
+    day_max = padded(max_temps)
+    day_min = padded(min_temps)
+    day_precip = padded(precipitation)
+    weekly_forecast = [
+        {
+            "date": times[i],
+            "max_temp": _to_value(day_max[i]),
+            "min_temp": _to_value(day_min[i]),
+            "precipitation": _to_value(day_precip[i]),
+            "weathercode": weathercodes[i] if i < len(weathercodes) else None
+        }
+        for i in range(days)
+    ]
 
-    # Aggregate weekly stats
-    if weekly_forecast and len(weekly_forecast) > 0:
-        avg_max_temp = sum([d['max_temp'] for d in weekly_forecast if d['max_temp'] is not None]) / len(weekly_forecast)
-        avg_min_temp = sum([d['min_temp'] for d in weekly_forecast if d['min_temp'] is not None]) / len(weekly_forecast)
-        total_precip = sum([d['precipitation'] for d in weekly_forecast if d['precipitation'] is not None])
+    # Aggregate weekly stats (averages are taken over all forecast days)
+    if days > 0:
+        avg_max_temp = float(np.nansum(day_max)) / days
+        avg_min_temp = float(np.nansum(day_min)) / days
+        total_precip = float(np.nansum(day_precip))
     else:
         avg_max_temp = avg_min_temp = total_precip = None
     
-    return {
+    features = {
         "current_temp": current_temp,
         "current_wind": current_wind,
         "temp_flag": temp_flag,
@@ -122,6 +267,10 @@ def process_weather_data(weather):
         "avg_min_temp": avg_min_temp,
         "total_precip": total_precip
     }
+    if dayparts is not None:
+        features["dayparts"] = dayparts
+        features["daypart_forecast"] = daypart_forecast
+    return features
 
 # Example usage if running this module directly:
 if __name__ == '__main__':
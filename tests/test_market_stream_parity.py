@@ -0,0 +1,84 @@
+import warnings
+
+import pytest
+
+from src.feature_extraction import process_store_data
+from src.market_stream import MarketAggregator
+from src.sentiment import check_resources, compute_store_sentiment
+from test_numpy_parity import BASIC, CASES, _assert_close, _plain, _store
+
+
+def _review(text):
+    return {"text": {"text": text, "languageCode": "en"}}
+
+
+def _without(store, *keys):
+    return {k: v for k, v in store.items() if k not in keys}
+
+
+# Some stores lack a primaryType (grouped as "unknown" for sentiment, skipped in
+# the metrics), one has primaryType None, and ratings are missing for others.
+MIXED_TYPES = [
+    BASIC[0],
+    _without(BASIC[1], "primaryType"),
+    dict(BASIC[2], primaryType=None),
+    _without(BASIC[3], "rating"),
+    _without(BASIC[4], "primaryType", "location"),
+]
+
+# Equal counts per type, so store_counts order depends on the value_counts tie rule.
+TIES = [
+    _store("A", "supermarket", 4.1, 42.3480, -71.1000),
+    _store("B", "grocery_store", 4.3, 42.3500, -71.1050),
+    _store("C", "convenience_store", 3.7, 42.3470, -71.0980),
+    _store("D", "grocery_store", 4.9, 42.3600, -71.1200),
+    _store("E", "supermarket", 3.3, 42.3300, -71.0800),
+    _store("F", "convenience_store", 4.4, 42.3410, -71.0900),
+]
+
+# Many ratings that are not exact in binary, so a naive running sum would drift.
+MANY = [
+    _store(f"S{i}", ("grocery_store", "supermarket", "convenience_store")[i % 3],
+           None if i % 7 == 0 else round(1 + (i * 0.37) % 4, 1),
+           42.30 + (i % 10) * 0.007, -71.15 + (i // 10) * 0.011)
+    for i in range(45)
+]
+
+WITH_REVIEWS = [
+    dict(BASIC[0], reviews=[_review("Great prices and friendly staff."), _review("Always clean.")]),
+    dict(BASIC[1], reviews=[_review("Terrible service, long lines.")]),
+    dict(_without(BASIC[2], "primaryType"), reviews=[_review("Decent."), {"originalText": {"text": "Love it!"}}]),
+    dict(BASIC[3], reviews=[]),
+    BASIC[4],
+]
+
+STREAM_CASES = dict(CASES, mixed_types=MIXED_TYPES, ties=TIES, many=MANY, with_reviews=WITH_REVIEWS)
+
+
+def _aggregate(stores, page_size):
+    aggregator = MarketAggregator()
+    for start in range(0, len(stores), page_size):
+        aggregator.add(stores[start:start + page_size])
+    return aggregator
+
+
+@pytest.mark.parametrize("page_size", [1, 2, 20])
+@pytest.mark.parametrize("name", STREAM_CASES)
+def test_streamed_metrics_match_buffered(name, page_size):
+    stores = STREAM_CASES[name]
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        _, expected = process_store_data(stores)
+    actual = _aggregate(stores, page_size).aggregated_metrics()
+    _assert_close(_plain(expected), _plain(actual), "aggregated_metrics")
+    # Counts and rating averages are exact, not just close.
+    assert list(actual["store_counts"].items()) == list(expected["store_counts"].items())
+    assert actual["avg_ratings"] == expected["avg_ratings"]
+
+
+@pytest.mark.skipif(not check_resources(), reason="VADER lexicon not installed")
+@pytest.mark.parametrize("page_size", [1, 2, 20])
+@pytest.mark.parametrize("name", STREAM_CASES)
+def test_streamed_sentiment_matches_buffered(name, page_size):
+    stores = STREAM_CASES[name]
+    assert _aggregate(stores, page_size).store_sentiment() == compute_store_sentiment(stores)
@@ -0,0 +1,131 @@
+import copy
+import json
+import math
+import warnings
+
+import pytest
+
+from src.cleaning import clean_store_data
+from src.feature_extraction import process_store_data
+from src.numpy_features import clean_store_records, process_store_records
+
+
+def _store(name, primary_type, rating, lat, lon, types=None):
+    store = {
+        "displayName": {"text": name, "languageCode": "en"},
+        "formattedAddress": f"{name} St, Boston, MA 02215, USA",
+        "primaryType": primary_type,
+        "types": types or [primary_type, "store", "establishment"],
+        "location": {"latitude": lat, "longitude": lon},
+    }
+    if rating is not None:
+        store["rating"] = rating
+    return store
+
+
+BASIC = [
+    _store("A", "grocery_store", 4.2, 42.3480, -71.1000, ["grocery_store", "food", "store"]),
+    _store("B", "supermarket", 4.5, 42.3500, -71.1050),
+    _store("C", "grocery_store", 3.9, 42.3470, -71.0980),
+    _store("D", "convenience_store", 4.0, 42.3600, -71.1200),
+    _store("E", "supermarket", 4.7, 42.3300, -71.0800),
+]
+
+MISSING_RATING = [
+    _store("A", "grocery_store", 4.2, 42.3480, -71.1000),
+    _store("B", "grocery_store", None, 42.3500, -71.1050),
+    _store("C", "supermarket", None, 42.3470, -71.0980),
+]
+
+MISSING_TYPES = [
+    {k: v for k, v in store.items() if k not in ("types", "primaryType")} for store in BASIC[:3]
+]
+
+MISSING_LOCATION = [
+    {k: v for k, v in store.items() if k != "location"} for store in BASIC[:3]
+]
+
+PARTIAL_LOCATION = [BASIC[0], {k: v for k, v in BASIC[1].items() if k != "location"}, BASIC[2]]
+
+SINGLE_STORE = [BASIC[0]]
+
+CASES = {
+    "basic": BASIC,
+    "missing_rating": MISSING_RATING,
+    "missing_types": MISSING_TYPES,
+    "missing_location": MISSING_LOCATION,
+    "partial_location": PARTIAL_LOCATION,
+    "single_store": SINGLE_STORE,
+    "empty": [],
+}
+
+
+# The same place returned twice (e.g. by two result pages), one copy without a rating.
+DUPLICATE_PLACES = [
+    dict(BASIC[0], id="place-a"),
+    dict(MISSING_RATING[1], id="place-b"),
+    dict(BASIC[0], id="place-a"),
+    dict(MISSING_RATING[1], id="place-b", rating=4.0),
+]
+
+CLEANING_CASES = dict(CASES, duplicate_places=DUPLICATE_PLACES)
+
+
+def _plain(value):
+    """Round-trip through JSON so NumPy scalars, tuples and NaN compare like plain values."""
+    return json.loads(json.dumps(value, default=float))
+
+
+def _assert_close(expected, actual, path="value"):
+    if isinstance(expected, dict):
+        assert isinstance(actual, dict), path
+        assert list(expected) == list(actual), path
+        for key in expected:
+            _assert_close(expected[key], actual[key], f"{path}.{key}")
+    elif isinstance(expected, list):
+        assert isinstance(actual, list) and len(expected) == len(actual), path
+        for i, (a, b) in enumerate(zip(expected, actual)):
+            _assert_close(a, b, f"{path}[{i}]")
+    elif isinstance(expected, float) or isinstance(actual, float):
+        if expected is None or actual is None:
+            assert expected is None and actual is None, path
+        elif math.isnan(expected):
+            assert math.isnan(actual), path
+        else:
+            assert actual == pytest.approx(expected, rel=1e-9, abs=1e-12), path
+    else:
+        assert expected == actual, path
+
+
+def _run(stores):
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        df, pandas_metrics = process_store_data(stores)
+    records, numpy_metrics = process_store_records(stores)
+    return df, pandas_metrics, records, numpy_metrics
+
+
+@pytest.mark.parametrize("name", CASES)
+def test_aggregated_metrics_match(name):
+    _, pandas_metrics, _, numpy_metrics = _run(CASES[name])
+    _assert_close(_plain(pandas_metrics), _plain(numpy_metrics), "aggregated_metrics")
+
+
+@pytest.mark.parametrize("name", CASES)
+def test_processed_columns_match(name):
+    df, _, records, _ = _run(CASES[name])
+    assert list(df.columns) == (list(records[0]) if records else [])
+    pandas_records = json.loads(df.to_json(orient="records", double_precision=15))
+    _assert_close(pandas_records, _plain(records), "processed_stores")
+
+
+@pytest.mark.parametrize("name", CLEANING_CASES)
+def test_cleaned_stores_match(name):
+    stores = CLEANING_CASES[name]
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        df = clean_store_data(copy.deepcopy(stores))
+    records = clean_store_records(copy.deepcopy(stores))
+    assert list(df.columns) == (list(records[0]) if records else [])
+    pandas_records = json.loads(df.to_json(orient="records", double_precision=15))
+    _assert_close(pandas_records, _plain(records), "cleaned_stores")
@@ -0,0 +1,137 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from src import prewarm
+
+
+class FakeClock:
+    """Stands in for the time module in src.prewarm; sleep() advances the clock."""
+
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+        self.slept = []
+
+    def time(self):
+        return self.now
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(prewarm, "time", fake)
+    return fake
+
+
+def test_parse_times_accepts_hh_mm():
+    assert prewarm.parse_times(["07:05", " 23:59", "0:00"]) == [(7, 5), (23, 59), (0, 0)]
+    assert prewarm.parse_times([]) == []
+
+
+@pytest.mark.parametrize("entry", ["bad", "25:00", "10:60", "24:00", "10", "10:", ":30", "-1:00", "10:30:00"])
+def test_parse_times_rejects_invalid_entries(entry):
+    with pytest.raises(ValueError, match="invalid prewarm time"):
+        prewarm.parse_times(["10:30", entry])
+
+
+def test_run_forever_returns_on_invalid_times(capsys):
+    worker = prewarm.PrewarmWorker(lambda zipcode, store_type: None, busy=None)
+    assert worker.run_forever(["25:00"]) is None
+    assert "PREWARM_TIMES_UTC is invalid" in capsys.readouterr().out
+    assert worker.stats()["rounds"] == 0
+
+
+def test_next_run_later_today():
+    now = datetime(2026, 3, 10, 9, 0, tzinfo=timezone.utc)
+    assert prewarm.next_run([(10, 30), (23, 0)], now) == datetime(2026, 3, 10, 10, 30, tzinfo=timezone.utc)
+
+
+def test_next_run_rolls_over_to_tomorrow():
+    now = datetime(2026, 3, 10, 23, 30, tzinfo=timezone.utc)
+    assert prewarm.next_run([(10, 30), (23, 0)], now) == datetime(2026, 3, 11, 10, 30, tzinfo=timezone.utc)
+
+
+def test_next_run_at_the_scheduled_minute_waits_a_day():
+    now = datetime(2026, 12, 31, 10, 30, tzinfo=timezone.utc)
+    assert prewarm.next_run([(10, 30)], now) == datetime(2027, 1, 1, 10, 30, tzinfo=timezone.utc)
+
+
+def test_next_run_without_times():
+    assert prewarm.next_run([]) is None
+
+
+def test_top_counts_only_the_traffic_window(clock):
+    tracker = prewarm.TrafficTracker()
+    tracker.record("02215", "grocery_store")
+    tracker.record("10001", "book_store")
+    clock.now += 100
+    tracker.record(" 02215 ", "Grocery_Store")
+    tracker.record("10001", "book_store")
+    tracker.record("10001", "book_store")
+    clock.now += 50
+
+    assert tracker.top(10, window=200) == [(("10001", "book_store"), 3), (("02215", "grocery_store"), 2)]
+    # The first two events are 150 s old and fall outside a 100 s window.
+    assert tracker.top(10, window=100) == [(("10001", "book_store"), 2), (("02215", "grocery_store"), 1)]
+    assert tracker.top(1, window=100) == [(("10001", "book_store"), 2)]
+    assert tracker.top(10, window=10) == []
+
+
+def test_hot_keys_lists_file_keys_first_without_duplicates(tmp_path, clock):
+    keys_file = tmp_path / "hot.csv"
+    keys_file.write_text(
+        "# zipcode,store_type\n"
+        "02215, Grocery_Store\n"
+        "not a key\n"
+        "\n"
+        "60601,cafe  # comment\n"
+        "02215,grocery_store\n"
+    )
+    tracker = prewarm.TrafficTracker()
+    for zipcode, store_type in [("10001", "book_store")] * 3 + [("02215", "grocery_store")] * 2:
+        tracker.record(zipcode, store_type)
+
+    assert prewarm.hot_keys(tracker, keys_file=str(keys_file), top_n=10) == [
+        ("02215", "grocery_store"), ("60601", "cafe"), ("10001", "book_store")
+    ]
+    assert prewarm.hot_keys(tracker, keys_file=str(keys_file), top_n=0) == [
+        ("02215", "grocery_store"), ("60601", "cafe")
+    ]
+
+
+def test_hot_keys_without_a_readable_file(tmp_path, clock):
+    tracker = prewarm.TrafficTracker()
+    tracker.record("10001", "book_store")
+    assert prewarm.hot_keys(tracker, keys_file=str(tmp_path / "missing.csv"), top_n=5) == [("10001", "book_store")]
+
+
+def test_rate_limiter_spaces_acquisitions(clock):
+    limiter = prewarm.RateLimiter(rate_per_minute=30)
+    start = clock.now
+    for _ in range(4):
+        limiter.acquire()
+    # The first token is available at once; each later one waits 60 / 30 = 2 s.
+    assert clock.now - start == pytest.approx(6.0)
+
+
+def test_rate_limiter_allows_bursts(clock):
+    limiter = prewarm.RateLimiter(rate_per_minute=60, burst=3)
+    for _ in range(3):
+        limiter.acquire()
+    assert clock.slept == []
+    limiter.acquire()
+    assert clock.now - 1_000_000.0 == pytest.approx(1.0)
+
+
+def test_rate_limiter_without_a_rate_never_waits(clock):
+    limiter = prewarm.RateLimiter(rate_per_minute=0)
+    for _ in range(100):
+        limiter.acquire()
+    assert clock.slept == []